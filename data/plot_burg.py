@@ -9,21 +9,23 @@ import numpy as np
 
 import sys
 
+from emotiv.montage import Montage
+
 if __name__ == "__main__":
     d = loadmat(sys.argv[1])
-    o1 = signal.detrend(d['raw'][0])
-    o2 = signal.detrend(d['raw'][1])
+    raw = signal.detrend(d['raw'][:2], axis=-1)
 
-    diff = o1 - o2
-    avg = (o1 + o2) / 2.0
+    montage = Montage(["O1", "O2"])
+    montage.channel("O1").channel("O2").bipolar("O1", "O2")
+    montage.add("(O1+O2)/2", {"O1": 0.5, "O2": 0.5})
 
-    data_labels = ["O1", "O2", "O1-O2", "(O1+O2)/2"]
-    datas = [o1, o2, diff, avg]
+    data_labels = montage.labels
+    datas = montage.apply(raw)
 
-    fig, axs = pl.subplots(nrows=1, ncols=4, sharey=True)
+    fig, axs = pl.subplots(nrows=1, ncols=len(montage), sharey=True)
     time = d['data']['time'][0][0][0][0]
 
-    for i in range(4):
+    for i in range(len(montage)):
         psd = spectrum.pburg(datas[i], order=8, NFFT=256, sampling=128.0)
         psd.run()
         p = 10 * np.log10(psd.get_converted_psd('onesided'))
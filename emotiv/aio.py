@@ -0,0 +1,229 @@
+# -*- coding: utf-8 -*-
+# vim:set et ts=4 sw=4:
+#
+## Copyright (C) 2013 Ozan Çağlayan <ocaglayan@gsu.edu.tr>
+##
+## This program is free software; you can redistribute it and/or modify
+## it under the terms of the GNU General Public License as published by
+## the Free Software Foundation; either version 2 of the License, or
+## (at your option) any later version.
+
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+## GNU General Public License for more details.
+
+## You should have received a copy of the GNU General Public License
+## along with this program; if not, write to the Free Software
+## Foundation, Inc., 675 Mass Ave, Cambridge, MA 02139, USA.
+
+"""\
+This module provides the AsyncEPOC class which streams decoded blocks
+to asyncio coroutines. It requires Python 3.
+
+The module is written without the async and await keywords so that
+the rest of the package can still be byte-compiled by Python 2. The
+iterators and context managers return futures instead.
+"""
+
+import collections
+
+try:
+    import asyncio
+    import concurrent.futures
+except ImportError:
+    raise ImportError("emotiv.aio requires Python 3 and asyncio.")
+
+from .epoc import EPOCError, EPOCTurnedOffError
+
+
+class BlockIterator(object):
+    """Async iterator over the blocks of an AsyncEPOC.
+
+    Up to maxsize blocks are queued. When the queue is full, the oldest
+    block is dropped if drop is True, otherwise reading from the
+    headset is paused until this iterator catches up.
+    """
+
+    def __init__(self, source, maxsize, drop):
+        self.maxsize = maxsize
+        self.drop = drop
+        self.dropped = 0
+        self._source = source
+        self._queue = collections.deque()
+        self._waiter = None
+        self._error = None
+        self._closed = False
+
+    def __aiter__(self):
+        return self
+
+    def __anext__(self):
+        future = self._source.loop.create_future()
+        if self._queue:
+            future.set_result(self._queue.popleft())
+            self._source._resume()
+        elif self._error is not None:
+            future.set_exception(self._error)
+        elif self._closed:
+            future.set_exception(StopAsyncIteration())
+        else:
+            # Resolved by put(), cancelling it doesn't lose a block
+            self._waiter = future
+        return future
+
+    def full(self):
+        return not self.drop and len(self._queue) >= self.maxsize
+
+    def put(self, block):
+        if self._waiter is not None and not self._waiter.done():
+            self._waiter.set_result(block)
+            self._waiter = None
+            return
+        self._waiter = None
+        if self.drop and len(self._queue) >= self.maxsize:
+            self._queue.popleft()
+            self.dropped += 1
+        self._queue.append(block)
+
+    def fail(self, error):
+        """End the iteration with error once the queue is consumed."""
+        self._error = error
+        if self._waiter is not None and not self._waiter.done():
+            self._waiter.set_exception(error)
+        self._waiter = None
+
+    def close(self):
+        """Stop iterating, queued blocks are discarded."""
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.clear()
+        if self._waiter is not None and not self._waiter.done():
+            self._waiter.set_exception(StopAsyncIteration())
+        self._waiter = None
+        self._source._unsubscribe(self)
+
+    def aclose(self):
+        self.close()
+        future = self._source.loop.create_future()
+        future.set_result(None)
+        return future
+
+
+class AsyncEPOC(object):
+    """Stream the blocks of an EPOC into an asyncio event loop.
+
+    USB reads and decoding run in a single worker thread per headset,
+    bridged into the loop with run_in_executor(), so the loop never
+    blocks however many clients iterate. Each aiter_blocks() call
+    returns an independent BlockIterator of (samples, timestamps)
+    tuples, where samples have the dtype of acquire_data() and
+    timestamps are the de-jittered local_clock() times of each sample.
+
+    Reading is paused while no one iterates or while a non-dropping
+    iterator is full, which is the backpressure towards the headset.
+    close() stops reading, ends all iterators and returns a future
+    resolved when the last USB read has returned.
+
+    It must be used from coroutines of a single running event loop.
+    The background stream of start_stream() reads the same endpoint,
+    so both can't be used at once.
+    """
+
+    def __init__(self, headset, packets_per_read=16, read_timeout=1000):
+        self.headset = headset
+        self.packets_per_read = packets_per_read
+        self.read_timeout = read_timeout
+        self.loop = None
+        self._executor = concurrent.futures.ThreadPoolExecutor(1)
+        self._iterators = []
+        self._pending = None
+        self._closed = False
+
+    def __aenter__(self):
+        future = self._get_loop().create_future()
+        future.set_result(self)
+        return future
+
+    def __aexit__(self, exc_type, exc, tb):
+        return self.close()
+
+    def _get_loop(self):
+        if self.loop is None:
+            # Bound to the loop of the first coroutine using it, raises
+            # RuntimeError outside of a running loop
+            self.loop = asyncio.get_running_loop()
+            self.headset.clock.reset()
+        return self.loop
+
+    def aiter_blocks(self, maxsize=16, drop=False):
+        """Return a new async iterator over the decoded blocks."""
+        if self._closed:
+            raise EPOCError("AsyncEPOC is closed.")
+        if self.headset.is_streaming():
+            raise EPOCError("Stop the background stream first.")
+        iterator = BlockIterator(self, maxsize, drop)
+        self._get_loop()
+        self._iterators.append(iterator)
+        self._resume()
+        return iterator
+
+    def _unsubscribe(self, iterator):
+        if iterator in self._iterators:
+            self._iterators.remove(iterator)
+
+    def _read(self):
+        """Read and decode a block, runs in the worker thread."""
+        headset = self.headset
+        try:
+            frames = headset.read_block(self.packets_per_read,
+                                        self.read_timeout)
+        except EPOCTurnedOffError:
+            # Keep waiting for the headset
+            return None
+        decoded = headset.decode_packets(frames)
+        headset.update_status(decoded)
+        samples = headset.get_samples(decoded)
+        return samples, headset.clock.update(samples["counter"],
+                                             headset.read_time)
+
+    def _resume(self):
+        """Schedule the next read unless one is in flight or reading
+        is paused."""
+        if self._closed or self._pending is not None:
+            return
+        if not self._iterators or any(it.full() for it in self._iterators):
+            return
+        self._pending = self.loop.run_in_executor(self._executor, self._read)
+        self._pending.add_done_callback(self._on_block)
+
+    def _on_block(self, future):
+        self._pending = None
+        if future.cancelled() or self._closed:
+            return
+        error = future.exception()
+        if error is not None:
+            for iterator in list(self._iterators):
+                iterator.fail(error)
+            return
+        block = future.result()
+        if block is not None and block[0].size:
+            for iterator in list(self._iterators):
+                iterator.put(block)
+        self._resume()
+
+    def close(self):
+        """Stop reading and end all iterators."""
+        self._closed = True
+        for iterator in list(self._iterators):
+            iterator.close()
+        self._executor.shutdown(wait=False)
+
+        future = self._get_loop().create_future()
+        if self._pending is None:
+            future.set_result(None)
+        else:
+            self._pending.add_done_callback(
+                lambda f: future.done() or future.set_result(None))
+        return future
@@ -17,14 +17,19 @@
 ## along with this program; if not, write to the Free Software
 ## Foundation, Inc., 675 Mass Ave, Cambridge, MA 02139, USA.
 
+from collections import OrderedDict
+
 import numpy as np
 
-from scipy import fftpack, signal
-from scipy.io import loadmat
+from scipy import fftpack, signal, sparse
+from scipy.signal import windows
 
 import time
 import nitime
 
+from . import storage, utils
+from .montage import Montage
+
 from matplotlib import pylab as pl
 
 def fft(data):
@@ -46,7 +51,7 @@ def psd_classify_channel(channel, block_size, time_range=None):
 
     # Steps between frequency points after PSD estimation (1, 0.5, 0.25, etc)
     psd_step = 128.0 / block_size
-    psd_res = (64 / psd_step) + 1
+    psd_res = int(64 / psd_step) + 1
     freqs = np.linspace(0, 64, psd_res)
 
     # Apply the filter
@@ -57,135 +62,533 @@ def psd_classify_channel(channel, block_size, time_range=None):
 
     return freqs, avg_psd
 
+class StreamFilter(object):
+    """Causal IIR filter keeping its state across blocks.
+
+    sos holds second-order sections as returned by
+    signal.butter(..., output="sos"). process() filters (samples x
+    channels) blocks, all channels in one call, continuing from where
+    the previous block ended so there's no transient at block edges.
+    The state of each of the n_channels channels starts at the steady
+    state of its first sample. Use highpass(), bandpass(), notch() and
+    cascade() to build the usual filters.
+    """
+
+    def __init__(self, sos, n_channels=1):
+        self.sos = np.atleast_2d(np.asarray(sos, dtype=np.float64))
+        self.n_channels = n_channels
+        # (sections x 2 x channels) unit steady state
+        self._zi = np.repeat(signal.sosfilt_zi(self.sos)[:, :, np.newaxis],
+                             n_channels, axis=2)
+        self.zi = None
+
+    @classmethod
+    def highpass(cls, cutoff, n_channels=1, fs=128.0, order=4):
+        return cls(signal.butter(order, cutoff / (fs / 2.0), "highpass",
+                                 output="sos"), n_channels)
+
+    @classmethod
+    def bandpass(cls, low, high, n_channels=1, fs=128.0, order=4):
+        return cls(signal.butter(order, [low / (fs / 2.0), high / (fs / 2.0)],
+                                 "bandpass", output="sos"), n_channels)
+
+    @classmethod
+    def notch(cls, freq=50.0, n_channels=1, fs=128.0, quality=30.0):
+        """Notch at freq, 50 or 60 Hz for the mains."""
+        b, a = signal.iirnotch(freq / (fs / 2.0), quality)
+        return cls(signal.tf2sos(b, a), n_channels)
+
+    @classmethod
+    def cascade(cls, *filters):
+        """Return a filter applying the given filters one after another."""
+        if len(set(f.n_channels for f in filters)) > 1:
+            raise ValueError("Filters have different numbers of channels.")
+        return cls(np.vstack([f.sos for f in filters]),
+                   filters[0].n_channels)
+
+    def reset(self):
+        """Forget the state, e.g. at the start of a new recording."""
+        self.zi = None
+
+    def process(self, block):
+        """Filter a (samples x channels) block, return the result."""
+        block = np.asarray(block, dtype=np.float64)
+        if block.ndim == 1:
+            return self.process(block[:, np.newaxis])[:, 0]
+        if block.shape[1] != self.n_channels:
+            raise ValueError("Expected %d channels, got %d." %
+                             (self.n_channels, block.shape[1]))
+        if not block.shape[0]:
+            return block.copy()
+        if self.zi is None:
+            self.zi = self._zi * block[0]
+        out, self.zi = signal.sosfilt(self.sos, block, axis=0, zi=self.zi)
+        return out
+
+# DPSS tapers and their eigenvalues cached per (N, NW)
+_dpss_cache = {}
+
+def get_dpss(N, NW=4):
+    """Return the DPSS tapers of length N with eigenvalues above 0.9,
+    as nitime does with low_bias=True, and their eigenvalues."""
+    key = (N, NW)
+    if key not in _dpss_cache:
+        tapers, eigvals = windows.dpss(N, NW, int(2 * NW), return_ratios=True)
+        keep = eigvals > 0.9
+        _dpss_cache[key] = (tapers[keep], eigvals[keep])
+    return _dpss_cache[key]
+
+def multitaper_psd(x, fs=128.0, NW=4):
+    """One-sided multitaper PSD along the last axis of x.
+
+    Any number of signals are stacked in the leading axes and computed
+    in one batch. The spectra of the tapers are averaged with their
+    eigenvalues as weights, i.e. nitime's multi_taper_psd() with
+    adaptive=False. Returns the frequencies and the PSDs.
+    """
+    x = np.asarray(x, dtype=np.float64)
+    N = x.shape[-1]
+    tapers, eigvals = get_dpss(N, NW)
+
+    x = x - x.mean(axis=-1)[..., np.newaxis]
+    spectra = np.fft.rfft(x[..., np.newaxis, :] * tapers, axis=-1)
+    power = spectra.real ** 2 + spectra.imag ** 2
+
+    # Weighted average over the tapers axis
+    psd = np.tensordot(power, eigvals / (eigvals.sum() * fs), axes=([-2], [0]))
+    psd[..., 1:(N + 1) // 2] *= 2
+    return np.fft.rfftfreq(N, 1.0 / fs), psd
+
+class SlidingPSD(object):
+    """Multitaper PSD of overlapping windows of a stream.
+
+    update() takes (samples x channels) blocks of any size. A spectrum
+    of all channels is computed every hop samples over the last window
+    samples, all the windows completed by a block in one batch. psd
+    holds the running average of the spectra since the last reset(),
+    or their exponential average if alpha is given, as a (frequencies
+    x channels) array.
+    """
+
+    def __init__(self, n_channels=1, window=256, hop=32, fs=128.0, NW=4,
+                 alpha=None):
+        self.n_channels = n_channels
+        self.window = window
+        self.hop = hop
+        self.fs = fs
+        self.NW = NW
+        self.alpha = alpha
+        self.freqs = np.fft.rfftfreq(window, 1.0 / fs)
+        self.reset()
+
+    def reset(self):
+        self.psd = np.zeros((self.freqs.size, self.n_channels))
+        self.n_windows = 0
+        self._buffer = np.zeros((0, self.n_channels))
+        self._next = 0
+
+    def update(self, block):
+        """Add samples, return the spectra of the windows they complete
+        as a (windows x frequencies x channels) array."""
+        block = np.asarray(block, dtype=np.float64)
+        if block.ndim == 1:
+            block = block[:, np.newaxis]
+        buf = np.concatenate((self._buffer, block))
+
+        starts = np.arange(self._next, buf.shape[0] - self.window + 1,
+                           self.hop)
+        if starts.size:
+            # (windows x channels x samples) view of the buffer
+            stride_t, stride_ch = buf.strides
+            windows_view = np.lib.stride_tricks.as_strided(
+                buf[starts[0]:],
+                shape=(starts.size, self.n_channels, self.window),
+                strides=(self.hop * stride_t, stride_ch, stride_t))
+            spectra = multitaper_psd(windows_view, self.fs, self.NW)[1]
+            spectra = spectra.transpose((0, 2, 1))
+            self._average(spectra)
+            self._next = starts[-1] + self.hop
+        else:
+            spectra = np.zeros((0, self.freqs.size, self.n_channels))
+
+        # Keep the samples of the next windows only
+        drop = min(self._next, buf.shape[0])
+        self._buffer = buf[drop:]
+        self._next -= drop
+        return spectra
+
+    def _average(self, spectra):
+        if self.alpha is None:
+            n = self.n_windows + spectra.shape[0]
+            self.psd += (spectra.sum(axis=0) -
+                         spectra.shape[0] * self.psd) / n
+        else:
+            for spectrum in spectra:
+                if self.n_windows:
+                    self.psd += self.alpha * (spectrum - self.psd)
+                else:
+                    self.psd[:] = spectrum
+        self.n_windows += spectra.shape[0]
+
+# Orthonormal bases of the CCA references cached per (frequencies,
+# harmonics, window length, sampling rate), the least recently used
+# are dropped beyond _CCA_CACHE_SIZE
+_CCA_CACHE_SIZE = 16
+_cca_cache = OrderedDict()
+
+def get_cca_references(freqs, n_samples, harmonics=2, fs=128.0):
+    """Return a (frequencies x samples x 2*harmonics) array of the Q
+    factors of the centered sine and cosine references at each
+    frequency and its harmonics."""
+    key = (tuple(freqs), harmonics, n_samples, fs)
+    if key in _cca_cache:
+        # Move to the most recently used end
+        _cca_cache[key] = _cca_cache.pop(key)
+    else:
+        t = np.arange(n_samples) / fs
+        bases = []
+        for f in freqs:
+            phases = 2 * np.pi * f * np.outer(t, np.arange(1, harmonics + 1))
+            y = np.hstack((np.sin(phases), np.cos(phases)))
+            bases.append(np.linalg.qr(y - y.mean(axis=0))[0])
+        _cca_cache[key] = np.array(bases)
+        if len(_cca_cache) > _CCA_CACHE_SIZE:
+            _cca_cache.popitem(last=False)
+    return _cca_cache[key]
+
+class CCADetector(object):
+    """SSVEP detection by canonical correlation analysis.
+
+    The largest canonical correlation between a window of all channels
+    and the references of each frequency scores the frequency. Windows
+    are (channels x samples) of any length, the references of the
+    recently used lengths are cached.
+    """
+
+    def __init__(self, freqs, harmonics=2, fs=128.0):
+        self.freqs = list(freqs)
+        self.harmonics = harmonics
+        self.fs = fs
+
+    def score(self, window):
+        """Return the canonical correlation of each frequency."""
+        x = np.atleast_2d(np.asarray(window, dtype=np.float64)).T
+        refs = get_cca_references(self.freqs, x.shape[0], self.harmonics,
+                                  self.fs)
+        qx = np.linalg.qr(x - x.mean(axis=0))[0]
+
+        # Singular values of Qx' Qy are the canonical correlations
+        products = np.tensordot(qx, refs, axes=([0], [1])).transpose((1, 0, 2))
+        return np.linalg.svd(products, compute_uv=False)[:, 0]
+
+    def detect(self, window):
+        """Return the index of the best scoring frequency and the
+        scores."""
+        scores = self.score(window)
+        return int(np.argmax(scores)), scores
+
+class SSVEPScorer(object):
+    """Score any number of SSVEP targets on a PSD.
+
+    Each target is scored by the mean power at a list of frequencies,
+    e.g. its harmonics and their neighbouring bins. The lists are
+    compiled into a sparse (targets x bins) matrix for PSDs with
+    resolution Hz between bins up to fs / 2, so scoring all targets
+    is one product whatever their number. As in the classifiers, a
+    frequency is scored at the bin at or below it, int(f / resolution),
+    which is only its nearest bin if resolution divides it.
+    """
+
+    def __init__(self, score_freqs, resolution=1.0, fs=128.0):
+        self.score_freqs = [list(freqs) for freqs in score_freqs]
+        self.resolution = resolution
+        self.n_bins = int(round(fs / 2.0 / resolution)) + 1
+
+        rows, cols, weights = [], [], []
+        for k, freqs in enumerate(self.score_freqs):
+            bins = [int(f / resolution) for f in freqs]
+            if not bins or min(bins) < 0 or max(bins) >= self.n_bins:
+                raise ValueError("Target %d has frequencies out of the PSD." % k)
+            rows.extend([k] * len(bins))
+            cols.extend(bins)
+            weights.extend([1.0 / len(bins)] * len(bins))
+        self.matrix = sparse.csr_matrix((weights, (rows, cols)),
+                                        shape=(len(self.score_freqs),
+                                               self.n_bins))
+
+    @staticmethod
+    def harmonic_freqs(freq, n_harmonics=2, resolution=1.0, neighbours=1,
+                       fs=128.0):
+        """Return the first n_harmonics harmonics of freq below fs / 2
+        with neighbours bins on each side of them. neighbours can also
+        be a list with a count per harmonic."""
+        if isinstance(neighbours, int):
+            neighbours = [neighbours] * n_harmonics
+        return [h * freq + j * resolution
+                for h, n in zip(range(1, n_harmonics + 1), neighbours)
+                for j in range(-n, n + 1)
+                if 0 <= h * freq + j * resolution <= fs / 2.0]
+
+    @classmethod
+    def harmonics(cls, freqs, n_harmonics=2, resolution=1.0, neighbours=1,
+                  fs=128.0):
+        """Score targets at freqs by their harmonic_freqs()."""
+        return cls([cls.harmonic_freqs(f, n_harmonics, resolution,
+                                       neighbours, fs) for f in freqs],
+                   resolution, fs)
+
+    def score(self, psd, axis=0):
+        """Return the scores of PSDs whose bins are along axis, e.g. a
+        (bins x channels) PSD of SlidingPSD, as (targets x channels)."""
+        psd = np.moveaxis(np.asarray(psd), axis, 0)
+        scores = self.matrix.dot(psd.reshape(psd.shape[0], -1))
+        return np.moveaxis(scores.reshape((-1,) + psd.shape[1:]), 0, axis)
+
+class GoertzelBank(object):
+    """Power of all channels at a few frequencies by the Goertzel
+    algorithm.
+
+    Each frequency and its harmonics up to the given number has a
+    two-pole resonator per channel. update() takes blocks of any size
+    down to one sample and advances all the resonators over the block
+    with one matrix product, in O(frequencies) per sample. power() is
+    in the units of a one-sided periodogram of the samples since the
+    last reset().
+
+    If window is given, power() is over the last window samples only.
+    The comb removing the older samples only cancels exactly at
+    multiples of fs / window, so the frequencies are rounded to them.
+    """
+
+    def __init__(self, freqs, harmonics=1, n_channels=1, fs=128.0,
+                 window=None):
+        self.n_channels = n_channels
+        self.harmonics = harmonics
+        self.fs = fs
+        self.window = window
+
+        freqs = np.outer(freqs, np.arange(1, harmonics + 1))
+        if window:
+            freqs = np.round(freqs * window / fs) * fs / window
+        if freqs.max() > fs / 2.0:
+            raise ValueError("Harmonics above %.1f Hz." % (fs / 2.0))
+        self.freqs = freqs[:, 0]
+        self._omegas = 2 * np.pi * freqs.ravel() / fs
+        self._coeffs = 2 * np.cos(self._omegas)
+        self._response = (None, None)
+        self.reset()
+
+    def reset(self):
+        # Last two outputs of each resonator
+        self._state = np.zeros((2, self._coeffs.size, self.n_channels))
+        self.n_samples = 0
+        if self.window:
+            self._history = np.zeros((self.window, self.n_channels))
+
+    def update(self, block):
+        """Add (samples x channels) samples and return power()."""
+        block = np.asarray(block, dtype=np.float64).reshape(
+            -1, self.n_channels)
+        x = block
+        if self.window:
+            # Add the new samples, remove the ones leaving the window
+            history = np.concatenate((self._history, block))
+            x = history[self.window:] - history[:-self.window]
+            self._history = history[-self.window:]
+
+        if x.shape[0]:
+            inputs, first, second = self._impulse_response(x.shape[0])
+            # The state acts as the inputs c*s1 - s2 and -s1 at the
+            # first two samples
+            s1, s2 = self._state
+            c = self._coeffs[:, np.newaxis]
+            self._state = np.dot(inputs, x) + \
+                first[:, :, np.newaxis] * (c * s1 - s2) - \
+                second[:, :, np.newaxis] * s1
+            self.n_samples += x.shape[0]
+        return self.power()
+
+    def _impulse_response(self, n):
+        """Return the weights of the n samples of a block, and of
+        inputs added to its first and second samples, in the last two
+        outputs of all the resonators. Cached for the last n."""
+        if self._response[0] != n:
+            # Impulse response h[j] = sin((j + 1) w) / sin(w) of the
+            # resonators from j = -2 to n - 1, with its limit at w = pi
+            k = np.arange(-1, n + 1)
+            w = self._omegas[:, np.newaxis]
+            sin_w = np.sin(w)
+            singular = np.abs(sin_w) < 1e-9
+            h = np.where(singular, k * np.cos(k * w) / np.cos(w),
+                         np.sin(k * w) / np.where(singular, 1.0, sin_w))
+
+            # Output n - 1 - r weighs the sample m with h[n - 1 - r - m]
+            inputs = np.array((h[:, n + 1:1:-1], h[:, n:0:-1]))
+            first = np.array((h[:, n + 1], h[:, n]))
+            second = np.array((h[:, n], h[:, n - 1]))
+            self._response = (n, (inputs, first, second))
+        return self._response[1]
+
+    def power(self, per_harmonic=False):
+        """Return the (frequencies x channels) power summed over the
+        harmonics, or (frequencies x harmonics x channels)."""
+        s1, s2 = self._state
+        c = self._coeffs[:, np.newaxis]
+        n = min(self.n_samples, self.window or self.n_samples)
+        p = (s1 ** 2 + s2 ** 2 - c * s1 * s2) * 2 / (self.fs * max(n, 1))
+        p = p.reshape(self.freqs.size, self.harmonics, self.n_channels)
+        return p if per_harmonic else p.sum(axis=1)
+
+# Channel combinations scored by psd_classifier()
+PSD_LABELS = ['o1', 'o2', 'o1-o2', 'o1-p7', 'o1-p8', 'o2-p7', 'o2-p8', 'o1-avg', 'o2-avg']
+
+class PSDResult(object):
+    """Outcome of psd_classifier().
+
+    Per trial and channel combination: votes holds the number of
+    blocks scored for the (left, right) frequencies, hits whether the
+    majority matched the cue and psd the PSD averaged over the blocks.
+    Per block, in trial order: trial_index, and left_power and
+    right_power, the scores of the cumulative average PSD of the trial
+    up to that block for each combination.
+    """
+
+    def __init__(self, labels, cues, freqs, left_scores, right_scores):
+        self.labels = labels
+        self.cues = cues
+        self.freqs = freqs
+        self.left_scores = left_scores
+        self.right_scores = right_scores
+
+    @property
+    def rates(self):
+        """Classification rates of each channel combination."""
+        return self.hits.mean(axis=0)
+
+    def as_array(self):
+        """Return the hits with the rates in an extra last row."""
+        return np.vstack((self.hits, self.rates))
+
+    def summary(self):
+        """Return the combinations classifying better than chance."""
+        return ["Channel: %s, Classification Rate: %.2f%%" % (label, rate * 100)
+                for label, rate in zip(self.labels, self.rates) if rate > 0.5]
+
 def psd_classifier(eeg_data, experiment, block_size, time_range=None):
+    """Classify the SSVEP trials by voting on block PSDs.
 
-    labels = ['o1', 'o2', 'o1-o2', 'o1-p7', 'o1-p8', 'o2-p7', 'o2-p8', 'o1-avg', 'o2-avg']
+    Each trial is high-pass filtered, the channel combinations of
+    PSD_LABELS are cut into blocks of block_size samples and the PSD
+    averaged up to each block votes for the frequency with the most
+    power. Returns a PSDResult.
+    """
+    labels = PSD_LABELS
 
     # Steps between frequency points after PSD estimation (1, 0.5, 0.25, etc)
     psd_step = 128.0/block_size
-    psd_res = (64 / psd_step) + 1
 
     n_trials = experiment['n_trials']
     channel_mask = experiment['channel_mask']
-    cues = experiment['cues']
+    cues = [cue.strip().lower() for cue in experiment['cues'][:n_trials]]
 
     left_freq = float(experiment['freq_left'])
     right_freq = float(experiment['freq_right'])
 
-    plot_left_bounds = min(left_freq, right_freq) - 2
-    plot_right_bounds = max(left_freq, right_freq)*2 + 2
-
-    if left_freq < 20:
-        left_scores = [left_freq, left_freq*2-psd_step, left_freq*2, left_freq*2 + psd_step]
-    else:
-        left_scores = [left_freq - psd_step, left_freq, left_freq + psd_step]
-
-    if right_freq < 20:
-        right_scores = [right_freq, right_freq*2-psd_step, right_freq*2, right_freq*2 + psd_step]
-    else:
-        right_scores = [right_freq - psd_step, right_freq, right_freq + psd_step]
-
-    print "Left freq powers @ ", left_scores
-    print "Right freq powers @ ", right_scores
-
-    # Classification results
-    results = np.zeros([n_trials + 1, len(labels)])
-
-    # Final averaged burg psd's
-    final_pxx = np.zeros([n_trials, psd_res, len(labels)])
+    # Frequencies below 20Hz are scored at their 2nd harmonic and its
+    # neighbours too, others at their neighbours
+    left_scores, right_scores = [
+        SSVEPScorer.harmonic_freqs(f, 2, psd_step, [0, 1]) if f < 20 else
+        SSVEPScorer.harmonic_freqs(f, 1, psd_step, 1)
+        for f in (left_freq, right_freq)]
+    scorer = SSVEPScorer([left_scores, right_scores], psd_step)
 
     # High-pass filter
     Wn = 5 / 64.0
     b, a = signal.butter(9, Wn, "highpass")
+    picks = ["O1", "O2", "P7", "P8"]
+    montage = Montage.from_labels(picks, labels)
+    picks = [channel_mask.index(ch) for ch in picks]
 
+    # Blocks of all trials and combinations, (combinations x blocks x samples)
+    blocks = []
+    n_blocks = np.zeros(n_trials, dtype=int)
     for t in range(n_trials):
         # FIXME: Use time_range
-
-        # Apply filter
-        o1 = signal.filtfilt(b, a, eeg_data[t][channel_mask.index("O1"), :].T)
-        o2 = signal.filtfilt(b, a, eeg_data[t][channel_mask.index("O2"), :].T)
-        p7 = signal.filtfilt(b, a, eeg_data[t][channel_mask.index("P7"), :].T)
-        p8 = signal.filtfilt(b, a, eeg_data[t][channel_mask.index("P8"), :].T)
-
-        # Find common average
-        avg = (o1 + o2 + p7 + p8) / 4.0
-
-        # Create an array of interesting channel combinations
-        chans = np.array([eval(c) for c in labels])
-
-        # Trial cue
-        cue = cues[t].strip().lower()
-
-        # Process each channel
-        for i in range(len(chans)):
-            pxx = np.zeros(psd_res)
-            avg_psd = np.zeros(psd_res)
-            hits = {"left" : 0, "right" : 0}
-
-            d = signal.detrend(chans[i])
-            iterations = d.size / block_size
-
-            print "Channel is %s, variance is %.2f" % (labels[i], np.var(d, ddof=1))
-
-            for it in range(iterations):
-                block = d[it * block_size: ((it+1) * block_size)]
-                #p = spectrum.pburg(block, 64, NFFT=128, sampling=128.0)
-                #p.run()
-                #avg_burg += 10*np.log10(p.psd)
-                freqs, n_pxx, l = nitime.algorithms.spectral.multi_taper_psd(block, Fs=128.0)
-                #freqs, n_pxx = nitime.algorithms.spectral.periodogram(block, Fs=128.0, N=128)
-                pxx += n_pxx
-                avg_psd = pxx / (it + 1)
-
-                fl_mean = avg_psd[[int(s/psd_step) for s in left_scores]].mean()
-                fr_mean = avg_psd[[int(s/psd_step) for s in right_scores]].mean()
-
-                if fl_mean > fr_mean:
-                    hits["left"] += 1
-                else:
-                    hits["right"] += 1
-
-                print "Trial %d (Cue: %s (%sHz)): [%d/%d] Left: %.2f (%d) Right: %.2f (%d)" % ((t + 1), cue, eval("%s_freq" % cue),
-                        (it + 1), iterations, fl_mean, hits["left"], fr_mean, hits["right"])
-                #pl.plot(freqs,10*np.log10(avg_psd))
-                #pl.show()
-
-
-            print "Left %d, Right %d for cue %s" % (hits["left"], hits["right"], cue)
-
-            # Record averaged PSD's
-            final_pxx[t, :, i] = avg_psd
-            #pl.plot(freqs,10*np.log10(avg_psd))
-            #pl.show()
-
-            if (hits["left"] > hits["right"] and cue == "left") or (hits["right"] > hits["left"] and cue == "right"):
-                results[t, i] = 1
-
-    # Calculate total scores
-    results[-1] = np.mean(results[:-1], axis=0)
-    for i in range(len(labels)):
-        if results[-1, i] > 0.5:
-            print "Channel: %s, Classification Rate: %.2f%%" % (labels[i], results[-1, i]*100)
-
-    #max_idx = np.where(results[-1] > 0.5)[0]
-    #print labels[c]
-
-    #return [(labels[c], results[:, c]) for c in max_idx]
-    return results
+        filtered = signal.filtfilt(b, a, eeg_data[t][picks, :], axis=-1)
+        d = signal.detrend(montage.apply(filtered), axis=-1)
+
+        n_blocks[t] = d.shape[1] // block_size
+        blocks.append(d[:, :n_blocks[t] * block_size].reshape(
+            len(labels), n_blocks[t], block_size))
+
+    freqs, pxx = multitaper_psd(np.concatenate(blocks, axis=1))
+    result = PSDResult(labels, cues, freqs, left_scores, right_scores)
+
+    # Block index where each trial starts and trial of each block
+    starts = np.concatenate(([0], np.cumsum(n_blocks)[:-1]))
+    result.trial_index = np.repeat(np.arange(n_trials), n_blocks)
+    position = np.arange(result.trial_index.size) - starts[result.trial_index]
+
+    def cumulative_mean(x):
+        # Mean of the blocks of each trial up to each block
+        total = np.cumsum(x, axis=-1)
+        before = np.concatenate((np.zeros(x.shape[:-1] + (1,)),
+                                 total[..., :-1]), axis=-1)
+        return (total - before[..., starts[result.trial_index]]) / \
+            (position + 1)
+
+    # Scores are linear in the PSD, so averaging them is the same as
+    # scoring the average PSD
+    scores = scorer.score(pxx, axis=-1)
+    result.left_power = cumulative_mean(scores[..., 0]).T
+    result.right_power = cumulative_mean(scores[..., 1]).T
+
+    # Votes and average PSDs per trial, trials without blocks get none
+    left_votes = np.zeros((n_trials, len(labels)), dtype=int)
+    psd = np.zeros((n_trials, freqs.size, len(labels)))
+    done = n_blocks > 0
+    if done.any():
+        left = (result.left_power > result.right_power).astype(int)
+        left_votes[done] = np.add.reduceat(left, starts[done], axis=0)
+        psd[done] = np.add.reduceat(pxx, starts[done], axis=1).transpose(
+            (1, 2, 0)) / n_blocks[done, np.newaxis, np.newaxis]
+    result.votes = np.dstack((left_votes, n_blocks[:, np.newaxis] - left_votes))
+    result.psd = psd
+
+    is_left = np.array([cue == "left" for cue in cues])[:, np.newaxis]
+    is_right = np.array([cue == "right" for cue in cues])[:, np.newaxis]
+    result.hits = (is_left & (result.votes[..., 0] > result.votes[..., 1])) | \
+        (is_right & (result.votes[..., 1] > result.votes[..., 0]))
+    return result
+
+def load_experiment(recording):
+    """Return the trials and the experiment dict of a Recording."""
+    m = recording.metadata
+    # A single cue is read back as a string
+    cues = m["cues"]
+    if isinstance(cues, utils.string_types):
+        cues = [cues]
+    exp = {
+            "n_trials"      : int(m.get("n_trials", len(recording))),
+            "channel_mask"  : recording.channels,
+            "cues"          : cues,
+            "freq_right"    : m["freq_right"],
+            "freq_left"     : m["freq_left"],
+          }
+    return list(recording.trials()), exp
 
 if __name__ == "__main__":
-    # Test code for classifier function above
+    # Test code for classifier function above, run it with
+    # python -m emotiv.analysis <dataset>
     import sys
 
-    m = loadmat(sys.argv[1])
-    eeg = m['data']['trial'][0][0][0]
-
-    exp = {
-            "n_trials"      : int(m["n_trials"]),
-            "channel_mask"  : [d.strip() for d in m['channel_mask'].tolist()],
-            "cues"          : [d.strip() for d in m['cues'].tolist()],
-            "freq_right"    : m['freq_right'][0].strip(),
-            "freq_left"     : m['freq_left'][0].strip(),
-          }
-
-    #results = psd_classifier(eeg, exp, 256)
+    eeg, exp = load_experiment(storage.Recording(sys.argv[1]))
+    result = psd_classifier(eeg, exp, 256)
+    print("Left freq powers @ %s" % result.left_scores)
+    print("Right freq powers @ %s" % result.right_scores)
+    for t, cue in enumerate(result.cues):
+        for i, label in enumerate(result.labels):
+            print("Trial %d (Cue: %s) %s: Left %d, Right %d" % (
+                t + 1, cue, label, result.votes[t, i, 0],
+                result.votes[t, i, 1]))
+    print("\n".join(result.summary()))
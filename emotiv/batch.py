@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+# vim:set et ts=4 sw=4:
+#
+## Copyright (C) 2013 Ozan Çağlayan <ocaglayan@gsu.edu.tr>
+##
+## This program is free software; you can redistribute it and/or modify
+## it under the terms of the GNU General Public License as published by
+## the Free Software Foundation; either version 2 of the License, or
+## (at your option) any later version.
+
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+## GNU General Public License for more details.
+
+## You should have received a copy of the GNU General Public License
+## along with this program; if not, write to the Free Software
+## Foundation, Inc., 675 Mass Ave, Cambridge, MA 02139, USA.
+
+"""\
+This module runs the classifiers of the analysis module over many
+recordings in parallel and gathers their results into one table.
+"""
+
+import os
+import sys
+import time
+import traceback
+import multiprocessing
+
+from . import analysis
+from .storage import Recording
+
+# Classifiers taking (trials, experiment, block_size) and returning a
+# result with an n_trials x labels array of hits
+CLASSIFIERS = {
+    "psd": (analysis.psd_classifier, analysis.PSD_LABELS),
+}
+
+# Columns of the result table
+COLUMNS = ("file", "classifier", "trial", "cue", "label", "hit")
+
+
+def _quiet():
+    # The classifiers print their progress, too much for a batch
+    sys.stdout = open(os.devnull, "w")
+
+
+def analyze(task):
+    """Run a classifier over a recording.
+
+    task is a (filename, classifier name, block size) tuple. Returns
+    a dict with the result "rows", the number of "trials" and
+    "samples" processed and the "error" if the file failed.
+    """
+    filename, name, block_size = task
+    classifier, labels = CLASSIFIERS[name]
+    result = {"file": filename, "rows": [], "trials": 0, "samples": 0,
+              "error": None}
+    try:
+        recording = Recording(filename)
+        eeg, exp = analysis.load_experiment(recording)
+        recording.close()
+        hits = classifier(eeg, exp, block_size).hits
+    except Exception:
+        result["error"] = traceback.format_exc()
+        return result
+
+    for t in range(exp["n_trials"]):
+        cue = exp["cues"][t].strip().lower()
+        for i, label in enumerate(labels):
+            result["rows"].append((filename, name, t + 1, cue, label,
+                                   int(hits[t, i])))
+    result["trials"] = exp["n_trials"]
+    result["samples"] = sum(trial.shape[1] for trial in eeg)
+    return result
+
+
+def run(filenames, classifier="psd", block_size=256, processes=None,
+        quiet=True, callback=None):
+    """Analyze recordings over a pool of processes, one per core by
+    default.
+
+    Returns the rows of the result table, the failed files mapped to
+    their errors and the throughput as a dict. callback is called with
+    the result of each file as it's done.
+    """
+    if classifier not in CLASSIFIERS:
+        raise ValueError("Unknown classifier %s." % classifier)
+
+    tasks = [(filename, classifier, block_size) for filename in filenames]
+    pool = multiprocessing.Pool(processes, _quiet if quiet else None)
+
+    rows = []
+    errors = {}
+    n_trials = n_samples = 0
+    start = time.time()
+    try:
+        # Files are handed out one at a time as they vary a lot in size
+        for result in pool.imap_unordered(analyze, tasks, chunksize=1):
+            if result["error"]:
+                errors[result["file"]] = result["error"]
+            rows.extend(result["rows"])
+            n_trials += result["trials"]
+            n_samples += result["samples"]
+            if callback:
+                callback(result)
+        pool.close()
+    except:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+
+    elapsed = max(time.time() - start, 1e-9)
+    rows.sort()
+    throughput = {
+        "files": len(tasks),
+        "trials": n_trials,
+        "samples": n_samples,
+        "elapsed": elapsed,
+        "files_per_sec": len(tasks) / elapsed,
+        "samples_per_sec": n_samples / elapsed,
+    }
+    return rows, errors, throughput
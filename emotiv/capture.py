@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+# vim:set et ts=4 sw=4:
+#
+## Copyright (C) 2013 Ozan Çağlayan <ocaglayan@gsu.edu.tr>
+##
+## This program is free software; you can redistribute it and/or modify
+## it under the terms of the GNU General Public License as published by
+## the Free Software Foundation; either version 2 of the License, or
+## (at your option) any later version.
+
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+## GNU General Public License for more details.
+
+## You should have received a copy of the GNU General Public License
+## along with this program; if not, write to the Free Software
+## Foundation, Inc., 675 Mass Ave, Cambridge, MA 02139, USA.
+
+"""\
+This module provides an append-only capture format for the raw
+encrypted packets of a headset.
+
+A capture file starts with a HEADER_SIZE bytes header followed by
+the packets exactly as they were read from the USB endpoint. Every
+index_interval seconds an (arrival time, packet offset) pair is
+appended to the index file next to it, named <capture>.idx. Both can
+be memory-mapped, nothing is decrypted or decoded while recording.
+"""
+
+import os
+import time
+import struct
+
+import numpy as np
+
+from .timing import local_clock
+
+MAGIC = b"EPOCRAW\x00"
+VERSION = 1
+HEADER_SIZE = 64
+
+# magic, version, sampling rate, serial, headset type, wall clock and
+# monotonic clock times at the start of the capture
+HEADER_FORMAT = "<8sHH16s16sdd"
+
+# Entries of the index file
+INDEX_DTYPE = np.dtype([("time", "<f8"), ("offset", "<u8")])
+
+
+def is_capture(filename):
+    """Return True if filename is a capture file."""
+    try:
+        with open(filename, "rb") as f:
+            return f.read(len(MAGIC)) == MAGIC
+    except IOError:
+        return False
+
+
+def read_header(filename):
+    """Return the header of a capture file as a dict."""
+    with open(filename, "rb") as f:
+        fields = struct.unpack(HEADER_FORMAT,
+                               f.read(struct.calcsize(HEADER_FORMAT)))
+    if fields[0] != MAGIC:
+        raise ValueError("%s is not a capture file." % filename)
+    return {
+        "version": fields[1],
+        "sampling_rate": fields[2],
+        "serial_number": str(fields[3].rstrip(b"\x00").decode()),
+        "headset_type": str(fields[4].rstrip(b"\x00").decode()),
+        "start_time": fields[5],
+        "start_clock": fields[6],
+    }
+
+
+class CaptureWriter(object):
+    """Append raw packets of a headset to a capture file."""
+
+    def __init__(self, filename, headset, index_interval=1.0):
+        self.filename = filename
+        self.index_interval = index_interval
+        self.n_packets = 0
+        self._last_index_time = None
+
+        self._file = open(filename, "wb")
+        self._index = open(filename + ".idx", "wb")
+
+        header = struct.pack(HEADER_FORMAT, MAGIC, VERSION,
+                             headset.sampling_rate,
+                             headset.serial_number.encode(),
+                             headset.headset_type.encode(),
+                             time.time(), local_clock())
+        self._file.write(header.ljust(HEADER_SIZE, b"\x00"))
+        self._file.flush()
+
+    def write(self, packets, arrival_time=None):
+        """Append encrypted packets which arrived at arrival_time."""
+        if isinstance(packets, np.ndarray):
+            packets = packets.data
+        if arrival_time is None:
+            arrival_time = local_clock()
+
+        if self._last_index_time is None or \
+                arrival_time - self._last_index_time >= self.index_interval:
+            # Index the first packet of this transfer and flush both
+            # files so that a crash loses one interval at most
+            entry = np.array([(arrival_time, self.n_packets)],
+                             dtype=INDEX_DTYPE)
+            self._file.flush()
+            entry.tofile(self._index)
+            self._index.flush()
+            self._last_index_time = arrival_time
+
+        self._file.write(packets)
+        self.n_packets += len(packets) // 32
+
+    def close(self):
+        self._file.close()
+        self._index.close()
+
+
+class CaptureReader(object):
+    """Memory-mapped access to the packets of a capture file.
+
+    Packets are only decrypted and decoded when they're requested,
+    which needs an EPOC set up with the serial number of the headset
+    in the header, see get_headset().
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.header = read_header(filename)
+
+        n_packets = (os.path.getsize(filename) - HEADER_SIZE) // 32
+        if n_packets > 0:
+            self.packets = np.memmap(filename, dtype=np.uint8, mode="r",
+                                     offset=HEADER_SIZE,
+                                     shape=(n_packets, 32))
+        else:
+            self.packets = np.zeros((0, 32), dtype=np.uint8)
+
+        try:
+            self.index = np.fromfile(filename + ".idx", dtype=INDEX_DTYPE)
+        except IOError:
+            self.index = np.zeros((0,), dtype=INDEX_DTYPE)
+
+        self._headset = None
+
+    def __len__(self):
+        return self.packets.shape[0]
+
+    def get_headset(self):
+        """Return an EPOC replaying this capture, used for decoding."""
+        if self._headset is None:
+            from .epoc import EPOC
+            self._headset = EPOC(method="replay", replay_file=self.filename,
+                                 replay_speed=0)
+        return self._headset
+
+    def time_to_packet(self, arrival_time):
+        """Return the packet offset at arrival_time, interpolated
+        between the index entries."""
+        if not self.index.size:
+            return 0
+        return int(np.interp(arrival_time, self.index["time"],
+                             self.index["offset"]))
+
+    def get_packets(self, start=0, stop=None):
+        """Return packets from start to stop decrypted."""
+        headset = self.get_headset()
+        encrypted = self.packets[start:stop]
+        return np.frombuffer(headset._cipher.decrypt(encrypted.tobytes()),
+                             dtype=np.uint8).reshape((-1, 32))
+
+    def get_samples(self, start=0, stop=None, channel_mask=None):
+        """Return the EEG samples in packets from start to stop."""
+        headset = self.get_headset()
+        if channel_mask:
+            headset.set_channel_mask(channel_mask)
+        decoded = headset.decode_packets(self.get_packets(start, stop))
+        return headset.get_samples(decoded, continuous=False)
@@ -0,0 +1,264 @@
+# -*- coding: utf-8 -*-
+# vim:set et ts=4 sw=4:
+#
+## Copyright (C) 2013 Ozan Çağlayan <ocaglayan@gsu.edu.tr>
+##
+## This program is free software; you can redistribute it and/or modify
+## it under the terms of the GNU General Public License as published by
+## the Free Software Foundation; either version 2 of the License, or
+## (at your option) any later version.
+
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+## GNU General Public License for more details.
+
+## You should have received a copy of the GNU General Public License
+## along with this program; if not, write to the Free Software
+## Foundation, Inc., 675 Mass Ave, Cambridge, MA 02139, USA.
+
+"""\
+This module provides the Catalog class which indexes the recordings
+of a data directory like ~/BCIData into an SQLite database.
+"""
+
+import os
+import re
+import time
+import hashlib
+import sqlite3
+
+from . import utils
+from .storage import Recording
+
+# Default data directory of the examples and its catalog
+DATA_DIR = os.path.expanduser("~/BCIData")
+CATALOG_NAME = "catalog.sqlite"
+
+# Extensions of the files which are indexed
+EXTENSIONS = (".mat", ".epoc")
+
+# Session directories of yes-no-bci.py, the comment may contain dashes
+SESSION_PATTERN = re.compile(
+    r"^(?P<initials>[^-]+)-(?P<n_trials>\d+)-trials-of-"
+    r"(?P<trial_duration>\d+)secs-(?P<comment>.*)-"
+    r"(?P<freq_left>[\d.]+)Hz-(?P<freq_right>[\d.]+)Hz-"
+    r"(?P<date>\d{2}-\d{2}-\d{4}_\d{2}-\d{2})$")
+
+SCHEMA = """\
+CREATE TABLE IF NOT EXISTS sessions (
+    path            TEXT PRIMARY KEY,
+    mtime           REAL,
+    size            INTEGER,
+    sha1            TEXT,
+    format          TEXT,
+    subject         TEXT,
+    date            TEXT,
+    comment         TEXT,
+    n_trials        INTEGER,
+    trial_duration  REAL,
+    freq_left       REAL,
+    freq_right      REAL,
+    fsample         REAL,
+    battery         REAL,
+    channel_mask    TEXT,
+    n_samples       INTEGER,
+    lost            INTEGER,
+    loss_ratio      REAL,
+    error           TEXT,
+    indexed_at      REAL
+);
+CREATE INDEX IF NOT EXISTS sessions_freq_left ON sessions (freq_left);
+CREATE INDEX IF NOT EXISTS sessions_freq_right ON sessions (freq_right);
+CREATE INDEX IF NOT EXISTS sessions_subject ON sessions (subject);
+"""
+
+COLUMNS = ("path", "mtime", "size", "sha1", "format", "subject", "date",
+           "comment", "n_trials", "trial_duration", "freq_left", "freq_right",
+           "fsample", "battery", "channel_mask", "n_samples", "lost",
+           "loss_ratio", "error", "indexed_at")
+
+
+def file_hash(filename, block_size=1 << 20):
+    """Return the SHA-1 of a file, read block_size bytes at a time."""
+    sha1 = hashlib.sha1()
+    with open(filename, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            sha1.update(block)
+    return sha1.hexdigest()
+
+
+def _number(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def describe(filename):
+    """Return the catalog entry of a recording as a dict.
+
+    Fields missing in the recording are taken from the name of the
+    session directory if it follows the naming of yes-no-bci.py.
+    """
+    stat = os.stat(filename)
+    entry = dict.fromkeys(COLUMNS)
+    entry.update({
+        "path": os.path.abspath(filename),
+        "mtime": stat.st_mtime,
+        "size": stat.st_size,
+        "sha1": file_hash(filename),
+        "indexed_at": time.time(),
+    })
+
+    match = SESSION_PATTERN.match(
+        os.path.basename(os.path.dirname(entry["path"])))
+    if match:
+        entry.update(match.groupdict())
+        entry["subject"] = entry.pop("initials")
+
+    try:
+        recording = Recording(filename)
+    except Exception as e:
+        # Keep unreadable files in the catalog so that they're not
+        # read again at each scan
+        entry["error"] = str(e)
+        return entry
+
+    metadata = recording.metadata
+    entry["format"] = recording.format
+    entry["fsample"] = recording.fsample
+    entry["n_trials"] = len(recording)
+    entry["channel_mask"] = ",".join(recording.channels)
+    for key in ("comment", "date", "trial_duration", "freq_left",
+                "freq_right", "battery"):
+        if key in metadata:
+            entry[key] = metadata[key]
+    entry["subject"] = metadata.get("initials", entry["subject"])
+
+    # Losses are counted per trial, trials aren't contiguous
+    n_samples = lost = 0
+    counters = [recording.counters(i) for i in range(len(recording))]
+    if all(c is not None for c in counters):
+        for ctr in counters:
+            if ctr.size:
+                lost += utils.analyze_packet_loss(ctr)["lost"]
+            n_samples += ctr.size
+        entry["lost"] = lost
+        entry["loss_ratio"] = float(lost) / (lost + n_samples) \
+            if n_samples else 0.0
+    else:
+        n_samples = sum(t.shape[1] for t in
+                        recording.trials(channels=recording.channels[:1]))
+    entry["n_samples"] = n_samples
+    recording.close()
+
+    for key in ("n_trials", "trial_duration", "freq_left", "freq_right",
+                "battery"):
+        entry[key] = _number(entry[key])
+    if entry["date"] is not None:
+        entry["date"] = str(entry["date"])
+    return entry
+
+
+class Catalog(object):
+    """SQLite index of the recordings under a data directory.
+
+    scan() only reads files which are new or changed since the last
+    scan, so it stays fast however many sessions there are. Use
+    query() to find sessions, e.g. all 15 Hz sessions with less than
+    1% packet loss:
+
+        catalog.query(freq=15, max_loss=0.01)
+    """
+
+    def __init__(self, root=DATA_DIR, database=None):
+        self.root = os.path.abspath(root)
+        if database is None:
+            database = os.path.join(self.root, CATALOG_NAME)
+        self.database = database
+        self._db = sqlite3.connect(database)
+        self._db.row_factory = sqlite3.Row
+        self._db.executescript(SCHEMA)
+
+    def close(self):
+        self._db.close()
+
+    def __len__(self):
+        return self._db.execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+
+    def _find_files(self):
+        for dirpath, dirnames, filenames in os.walk(self.root):
+            for filename in filenames:
+                if filename.endswith(EXTENSIONS):
+                    yield os.path.join(dirpath, filename)
+
+    def scan(self, verbose=False):
+        """Index new and changed files, forget the removed ones.
+
+        Returns the numbers of added or updated and of removed entries.
+        """
+        known = dict((row["path"], (row["mtime"], row["size"]))
+                     for row in self._db.execute(
+                         "SELECT path, mtime, size FROM sessions"))
+        updated = 0
+        seen = set()
+        insert = "INSERT OR REPLACE INTO sessions (%s) VALUES (%s)" % \
+            (", ".join(COLUMNS), ", ".join("?" * len(COLUMNS)))
+
+        for filename in self._find_files():
+            path = os.path.abspath(filename)
+            seen.add(path)
+            stat = os.stat(path)
+            if known.get(path) == (stat.st_mtime, stat.st_size):
+                continue
+            if verbose:
+                print("Indexing %s" % path)
+            entry = describe(path)
+            self._db.execute(insert, [entry[c] for c in COLUMNS])
+            updated += 1
+            # Commit now and then so an interrupted scan isn't lost
+            if updated % 100 == 0:
+                self._db.commit()
+
+        removed = [(path, ) for path in known if path not in seen]
+        self._db.executemany("DELETE FROM sessions WHERE path = ?", removed)
+        self._db.commit()
+        return updated, len(removed)
+
+    def select(self, where="1", params=(), order_by="path"):
+        """Return the entries matching an SQL condition as dicts."""
+        rows = self._db.execute(
+            "SELECT * FROM sessions WHERE %s ORDER BY %s" % (where, order_by),
+            params)
+        return [dict(row) for row in rows]
+
+    def query(self, freq=None, subject=None, max_loss=None, min_battery=None,
+              min_duration=None, channels=None):
+        """Return the entries matching all of the given criteria.
+
+        freq matches either stimulation frequency, channels is a list
+        of labels which should all be recorded. Files which couldn't
+        be read are never returned.
+        """
+        where = ["error IS NULL"]
+        params = []
+        if freq is not None:
+            where.append("(freq_left = ? OR freq_right = ?)")
+            params += [float(freq), float(freq)]
+        if subject is not None:
+            where.append("subject = ?")
+            params.append(subject)
+        if max_loss is not None:
+            where.append("loss_ratio < ?")
+            params.append(max_loss)
+        if min_battery is not None:
+            where.append("battery >= ?")
+            params.append(min_battery)
+        if min_duration is not None:
+            where.append("trial_duration >= ?")
+            params.append(min_duration)
+        for ch in channels or []:
+            where.append("(',' || channel_mask || ',') LIKE ?")
+            params.append("%%,%s,%%" % ch)
+        return self.select(" AND ".join(where), params)
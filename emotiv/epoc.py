@@ -23,6 +23,8 @@ EEG headsets.
 """
 
 import os
+import array
+import threading
 
 from Crypto.Cipher import AES
 
@@ -31,7 +33,11 @@ import usb.util
 
 import numpy as np
 
-import utils
+from . import utils
+from . import replay
+from . import capture
+from .ringbuffer import RingBuffer, SharedRingBuffer
+from .timing import SampleClock, local_clock
 
 
 class EPOCError(Exception):
@@ -131,7 +137,14 @@ class EPOC(object):
         'QU': [99,100,101,102,103,104,105,106,107,108,109,110,111,112],
     }
 
-    def __init__(self, method="libusb", serial_number=None, enable_gyro=True):
+    # Electrode index for each counter value, -1 where the quality is
+    # unknown. Comprehensions can't see the class scope on Python 3.
+    cq_index = np.array(list(map(dict(zip(channels, range(len(channels)))).get,
+                                 cq_order, [-1] * len(cq_order))))
+
+    def __init__(self, method="libusb", serial_number=None, enable_gyro=True,
+                 replay_file=None, replay_speed=1.0, replay_loop=False,
+                 replay_unit=None):
         self.vendor_id = None
         self.product_id = None
         self.decryption = None
@@ -144,9 +157,26 @@ class EPOC(object):
         self.gyroX = 0
         self.gyroY = 0
 
-        # Access method can be direct/libusb/dummy (Default: libusb)
+        # Counter of the last EEG packet to flag losses across blocks
+        self._last_eeg_counter = None
+
+        # Arrival time of the last USB transfer and the de-jittered
+        # timestamp of the last sample returned by get_sample()
+        self.read_time = None
+        self.timestamp = None
+        self.clock = SampleClock(self.sampling_rate)
+
+        # Access method can be direct/libusb/dummy/replay (Default: libusb)
         # If dummy is given the class behaves as a random signal generator
+        # If replay is given replay_file is played back at replay_speed
+        # times the sampling rate, as fast as possible if it's 0 or None.
+        # replay_unit is the unit of MAT files which don't store it,
+        # "uV" or "raw", see replay.ReplayEndpoint
         self.method = method
+        self.replay_file = replay_file
+        self.replay_speed = replay_speed
+        self.replay_loop = replay_loop
+        self.replay_unit = replay_unit
 
         # One may like to specify the dongle with its serial
         self.serial_number = serial_number
@@ -158,6 +188,27 @@ class EPOC(object):
         # By default acquire from all channels
         self.channel_mask = self.channels
 
+        # Gather tables for decode_packets() cached per channel mask
+        self._level_tables = {}
+
+        # Preallocated buffer for read_block() and its uint8 view
+        self._block_buffer = array.array('B')
+        self._block_frames = np.frombuffer(self._block_buffer, dtype=np.uint8)
+
+        # Raw packet capture, see start_capture()
+        self._capture = None
+
+        # Ring buffers and reader thread of the background acquisition
+        self.stream = None
+        self.timestamps = None
+        self._stream_created = False
+        self._stream_thread = None
+        self._stream_stop = threading.Event()
+        self._stream_error = None
+
+        # asyncio bridge, see aiter_blocks()
+        self._async = None
+
         # Dict for storing contact qualities
         self.quality = {
             "F3": 0, "FC5": 0, "AF3": 0, "F7": 0,
@@ -172,25 +223,32 @@ class EPOC(object):
         # Enumerate the bus to find EPOC devices
         self.enumerate()
 
-    def _is_epoc(self, device):
+    @classmethod
+    def _is_epoc(cls, device):
         """Custom match function for libusb."""
         try:
             manu = usb.util.get_string(device, device.iManufacturer)
-        except usb.core.USBError, usb_exception:
+        except usb.core.USBError as usb_exception:
             # If the udev rule is installed, we shouldn't get an exception
             # for Emotiv device.
-            print usb_exception
+            print(usb_exception)
             return False
         else:
-            if manu and manu.startswith(self.MANUFACTURER_PREFIX):
-                print manu
+            if manu and manu.startswith(cls.MANUFACTURER_PREFIX):
+                print(manu)
                 return True
                 # FIXME: This may not be necessary at all Found a dongle, check for interface class 3
                 for interf in device.get_active_configuration():
                     if_str = usb.util.get_string(device, interf.iInterface)
-                    if if_str == self.INTERFACE_DESC:
+                    if if_str == cls.INTERFACE_DESC:
                         return True
 
+    @classmethod
+    def get_serial_numbers(cls):
+        """Return the serial numbers of all the plugged EPOC dongles."""
+        return [usb.util.get_string(dev, dev.iSerialNumber) for dev in
+                usb.core.find(find_all=True, custom_match=cls._is_epoc)]
+
     def set_channel_mask(self, channel_mask):
         """Set channels from which to acquire."""
         self.channel_mask = channel_mask
@@ -198,11 +256,28 @@ class EPOC(object):
     def enumerate(self):
         """Traverse through USB bus and enumerate EPOC devices."""
         if self.method == "dummy":
-            self.endpoint = open("/dev/urandom")
+            self.endpoint = open("/dev/urandom", "rb")
             self.get_sample = self.__get_sample_dummy
             return
 
-        devices = usb.core.find(find_all=True, custom_match=self._is_epoc)
+        if self.method == "replay":
+            if capture.is_capture(self.replay_file):
+                # Captured packets are encrypted for the captured headset
+                header = capture.read_header(self.replay_file)
+                self.serial_number = header["serial_number"]
+                self.headset_type = header["headset_type"]
+            elif not self.serial_number:
+                self.serial_number = replay.SERIAL_NUMBER
+            self.setup_encryption()
+            self.endpoint = replay.ReplayEndpoint(self, self.replay_file,
+                                                  self.replay_speed,
+                                                  self.replay_loop,
+                                                  self.replay_unit)
+            self.headset_on = True
+            return
+
+        devices = list(usb.core.find(find_all=True,
+                                     custom_match=self._is_epoc))
 
         if not devices:
             raise EPOCNotPluggedError("Emotiv EPOC not found.")
@@ -219,7 +294,7 @@ class EPOC(object):
             self.product_id = "%x" % dev.idProduct
 
             if self.product_id == "0001":
-                print "Consumer headset detected."
+                print("Consumer headset detected.")
                 self.headset_type = "consumer"
 
             if self.method == "libusb":
@@ -235,13 +310,16 @@ class EPOC(object):
                     interface, bEndpointAddress=usb.ENDPOINT_IN | 2)
             elif self.method == "direct":
                 if os.path.exists("/dev/emotiv_epoc"):
-                    self.endpoint = open("/dev/emotiv_epoc")
+                    self.endpoint = open("/dev/emotiv_epoc", "rb")
                 else:
                     raise EPOCDeviceNodeNotFoundError(
                         "/dev/emotiv_epoc doesn't exist.")
 
             # Return the first Emotiv headset by default
             break
+        else:
+            raise EPOCNotPluggedError(
+                "Emotiv EPOC with S/N %s not found." % self.serial_number)
 
         self.setup_encryption()
         # Attempt to see whether the headset is turned on
@@ -250,7 +328,7 @@ class EPOC(object):
         except usb.USBError as ue:
             if ue.errno == 110:
                 self.headset_on = False
-                print "Setup is OK but make sure that headset is turned on."
+                print("Setup is OK but make sure that headset is turned on.")
         else:
             self.headset_on = True
 
@@ -278,7 +356,8 @@ class EPOC(object):
                                            self.serial_number[13], '\x00',
                                            self.serial_number[12], '\x50'])
 
-        self._cipher = AES.new(self.decryption_key)
+        self._cipher = AES.new(self.decryption_key.encode("latin-1"),
+                               AES.MODE_ECB)
 
     def set_external_decryption(self):
         """Use another process for concurrent decryption."""
@@ -289,110 +368,336 @@ class EPOC(object):
         self.decryption.daemon = True
         self.decryption.start()
 
+    def _get_level_table(self):
+        """Return the gather table for the current channel mask."""
+        key = tuple(self.channel_mask)
+        if key not in self._level_tables:
+            # Contact quality bits are gathered as an extra last channel
+            self._level_tables[key] = utils.get_level_table(
+                [self.bit_indexes[n] for n in key] + [self.bit_indexes["QU"]])
+        return self._level_tables[key]
+
+    def decode_packets(self, packets):
+        """Decode N decrypted 32-byte packets in a single pass.
+
+        Returns a dict of arrays: "counter", "gyroX", "gyroY" and
+        "quality" with N elements and "levels" with (N x channels)
+        elements for the current channel mask. Levels and qualities are
+        raw values, multiply levels with vres to get microvolts.
+        """
+        frames = utils.get_frames(packets)
+        levels = utils.get_levels(frames, self._get_level_table())
+        gyro_lsb = frames[:, 31]
+        return {
+            "counter": frames[:, 0].copy(),
+            "levels": levels[:, :-1],
+            "quality": levels[:, -1],
+            "gyroX": (frames[:, 29].astype(np.uint16) << 4) | (gyro_lsb >> 4),
+            "gyroY": (frames[:, 30].astype(np.uint16) << 4) | (gyro_lsb & 0x0F),
+        }
+
+    def update_status(self, decoded):
+        """Update counter, battery, gyro and contact qualities from
+        the packets decoded by decode_packets()."""
+        counters = decoded["counter"]
+        if not counters.size:
+            return
+
+        # Battery packets have counters >= 128
+        battery = np.flatnonzero(counters >= 128)
+        if battery.size:
+            self.battery = self.battery_levels[int(counters[battery[-1]])]
+
+        if self.enable_gyro:
+            self.gyroX = int(decoded["gyroX"][-1])
+            self.gyroY = int(decoded["gyroY"][-1])
+
+        # Set a synthetic counter for battery packets: 128
+        self.counter = min(int(counters[-1]), 128)
+
+        # Keep the last reported quality of each electrode, in the
+        # scale of the level in uV / 540 as always
+        eeg = np.flatnonzero(counters < 128)[::-1]
+        electrodes = self.cq_index[counters[eeg]]
+        electrodes, last = np.unique(electrodes, return_index=True)
+        for electrode, i in zip(electrodes, last):
+            if electrode >= 0:
+                self.quality[self.channels[electrode]] = \
+                    self.vres * decoded["quality"][eeg[i]] / 540.0
+
+    def get_samples(self, decoded, continuous=True):
+        """Return the EEG packets of decoded as an array of samples.
+
+        The array has the packed record dtype of utils.get_sample_dtype()
+        and battery packets are skipped. If continuous is False, decoded
+        doesn't follow the previous packets and its first sample is not
+        checked for losses.
+        """
+        counters = decoded["counter"]
+        eeg = np.flatnonzero(counters < 128)
+
+        samples = np.zeros(eeg.size,
+                           dtype=utils.get_sample_dtype(len(self.channel_mask)))
+        if not eeg.size:
+            return samples
+
+        samples["counter"] = counters[eeg]
+        samples["levels"] = decoded["levels"][eeg]
+        if self.enable_gyro:
+            samples["gyroX"] = decoded["gyroX"][eeg]
+            samples["gyroY"] = decoded["gyroY"][eeg]
+
+        # Flag samples following lost packets
+        previous = np.empty(eeg.size, dtype=np.intp)
+        previous[1:] = samples["counter"][:-1]
+        if self._last_eeg_counter is None or not continuous:
+            previous[0] = int(samples["counter"][0]) - 1
+        else:
+            previous[0] = self._last_eeg_counter
+        lost = (samples["counter"] - previous - 1) % 128 != 0
+        samples["flags"][lost] |= utils.FLAG_LOST_BEFORE
+        self._last_eeg_counter = int(samples["counter"][-1])
+
+        return samples
+
     def __get_sample_dummy(self):
         """Read random dummy samples."""
         raw_data = self.endpoint.read(32)
-        return [utils.get_level(raw_data, self.bit_indexes[n]) for n in self.channel_mask]
+        return (self.vres * self.decode_packets(raw_data)["levels"][0]).tolist()
+
+    def _raise_usb_error(self, usb_exception):
+        """Raise the EPOCError corresponding to a USBError."""
+        if usb_exception.errno == 110:
+            self.headset_on = False
+            raise EPOCTurnedOffError(
+                    "Make sure that headset is turned on")
+        else:
+            raise EPOCUSBError("USB I/O error with errno = %d" %
+                    usb_exception.errno)
 
     def get_sample(self):
         """Returns an array of EEG samples."""
         try:
-            raw_data = self._cipher.decrypt(self.endpoint.read(32))
-            # Parse counter
-            ctr = ord(raw_data[0])
-            # Update gyro's if requested
-            if self.enable_gyro:
-                self.gyroX = ((ord(raw_data[29]) << 4) | (ord(raw_data[31]) >> 4))
-                self.gyroY = ((ord(raw_data[30]) << 4) | (ord(raw_data[31]) & 0x0F))
-            if ctr < 128:
-                self.counter = ctr
-                # Contact qualities
-                if self.cq_order[ctr]:
-                    self.quality[self.cq_order[ctr]] = utils.get_level(raw_data, self.bit_indexes["QU"]) / 540.0
+            raw_data = self.endpoint.read(32)
+            self.read_time = local_clock()
+            if self._capture:
+                self._capture.write(raw_data, self.read_time)
+            decoded = self.decode_packets(self._cipher.decrypt(raw_data))
+            self.update_status(decoded)
+            if self.counter < 128:
+                self.timestamp = self.clock.update([self.counter],
+                                                   self.read_time)[0]
                 # Finally EEG data
-                return [0.51 * utils.get_level(raw_data, self.bit_indexes[n]) for n in self.channel_mask]
+                return (self.vres * decoded["levels"][0]).tolist()
             else:
-                # Set a synthetic counter for this special packet: 128
-                self.counter = 128
-                # Parse battery level
-                self.battery = self.battery_levels[ctr]
+                # Battery packet
                 return []
         except usb.USBError as usb_exception:
-            if usb_exception.errno == 110:
-                self.headset_on = False
-                raise EPOCTurnedOffError(
-                        "Make sure that headset is turned on")
+            self._raise_usb_error(usb_exception)
+
+    def read_block(self, n_packets, timeout=None):
+        """Read n_packets packets and decrypt them with a single call.
+
+        The packets are read into a buffer which is only reallocated
+        when n_packets changes. Returns an (n x 32) uint8 view of the
+        decrypted packets where n is less than n_packets if the device
+        returned less data. The view is overwritten by the next call.
+        """
+        size = 32 * n_packets
+        if len(self._block_buffer) != size:
+            self._block_buffer = array.array('B', bytearray(size))
+            self._block_frames = np.frombuffer(self._block_buffer,
+                                               dtype=np.uint8)
+
+        try:
+            if self.method == "libusb":
+                # pyusb fills the given array and returns the byte count
+                n_bytes = self.endpoint.read(self._block_buffer, timeout)
             else:
-                raise EPOCUSBError("USB I/O error with errno = %d" %
-                        usb_exception.errno)
+                n_bytes = self.endpoint.readinto(self._block_buffer)
+        except usb.USBError as usb_exception:
+            self._raise_usb_error(usb_exception)
+        self.read_time = local_clock()
+
+        frames = self._block_frames[:n_bytes - (n_bytes % 32)]
+        if self._capture:
+            self._capture.write(frames, self.read_time)
+        if self.method != "dummy":
+            # Decrypt all packets at once, in place
+            view = memoryview(frames)
+            self._cipher.decrypt(view, output=view)
+        return frames.reshape((-1, 32))
 
     def acquire_data(self, duration):
-        """Acquire data from the EPOC headset."""
+        """Acquire data from the EPOC headset.
+
+        Returns an array of samples, see get_samples().
+        """
 
         total_samples = duration * self.sampling_rate
-        _buffer = np.ndarray((total_samples, len(self.channel_mask) + 1),
-                dtype=np.uint16)
+        _buffer = np.zeros(total_samples,
+                dtype=utils.get_sample_dtype(len(self.channel_mask)))
         ctr = 0
+        # The previous acquisition may have ended long ago
+        self._last_eeg_counter = None
         while ctr < total_samples:
-            # Fetch new data
-            data = self.get_sample()
-            if data:
-                # Prepend sequence numbers
-                _buffer[ctr] = np.insert(np.array(data), 0, self.counter)
-                ctr += 1
+            # Fetch new data, battery packets are skipped. A read lasts
+            # up to duration seconds, longer than the default timeout
+            decoded = self.decode_packets(
+                    self.read_block(total_samples - ctr,
+                                    timeout=(duration + 1) * 1000))
+            self.update_status(decoded)
+            samples = self.get_samples(decoded)[:total_samples - ctr]
+            _buffer[ctr:ctr + samples.size] = samples
+            ctr += samples.size
 
         return _buffer
 
     def acquire_data_fast(self, duration, stop_callback=None, stop_callback_param=None):
-        """A more optimized method to acquire data from the EPOC headset without calling get_sample()."""
-
-        def get_level(raw_data, bits):
-            """Returns signal level from raw_data frame."""
-            level = 0
-            for i in range(13, -1, -1):
-                level <<= 1
-                b, o = (bits[i] / 8) + 1, bits[i] % 8
-                level |= (ord(raw_data[b]) >> o) & 1
-            # Return level in uV (microVolts)
-            return level
-
-        bit_indexes = [self.bit_indexes[n] for n in self.channel_mask]
-        # Packet idx to keep track of losses
-        idx = []
-        total_samples = duration * self.sampling_rate
+        """A more optimized method to acquire data from the EPOC headset
+        in a single read. Returns an array of samples, see get_samples()."""
 
-        # Pre-allocated array
-        _buffer = np.ndarray((total_samples, len(self.channel_mask)), dtype=np.float64)
+        total_samples = duration * self.sampling_rate
 
         # Acquire in one read, this should be more robust against drops
-        raw_data = self._cipher.decrypt(self.endpoint.read(32 * (total_samples + duration + 1), timeout=(duration+1)*1000))
+        frames = self.read_block(total_samples + duration + 1,
+                                 timeout=(duration + 1) * 1000)
 
         if stop_callback and stop_callback_param:
             stop_callback(stop_callback_param)
 
-        # Split data back into 32-byte chunks, skipping 1st packet
-        split_data = [raw_data[i:i + 32] for i in range(32, len(raw_data), 32)]
-
-        # Loop ctr
-        c = 0
-        for block in split_data:
-            if c == total_samples:
-                break
-            # Parse counter
-            ctr = ord(block[0])
-            # Skip battery
-            if ctr < 128:
-                idx.append(ctr)
-                _buffer[c] = [0.51 * get_level(block, bi) for bi in bit_indexes]
-                c += 1
-                # Update qualities as well
-                if self.cq_order[ctr] is not None:
-                    self.quality[self.cq_order[ctr]] = utils.get_level(block, self.bit_indexes["QU"]) / 540.0
-            else:
-                # Parse battery level
-                self.battery = self.battery_levels[ctr]
+        # Decode all packets at once, skipping 1st packet
+        decoded = self.decode_packets(frames[1:])
+        self.update_status(decoded)
+
+        # The previous acquisition may have ended long ago
+        return self.get_samples(decoded, continuous=False)[:total_samples]
+
+    def create_stream(self, buffer_duration=60, shared=False):
+        """Allocate the buffers of start_stream() without starting the
+        reader thread.
 
-        return idx, _buffer
+        The next start_stream() uses these buffers. With shared=True,
+        fork the processes reading them between the two calls so that
+        they are not forked while the reader thread is running.
+        """
+        if self._stream_thread:
+            raise EPOCError("Stream is already started.")
+
+        capacity = buffer_duration * self.sampling_rate
+        ring = SharedRingBuffer if shared else RingBuffer
+        self.stream = ring(capacity,
+                dtype=utils.get_sample_dtype(len(self.channel_mask)))
+        self.timestamps = ring(capacity)
+        self._stream_created = True
+
+    def start_stream(self, buffer_duration=60, packets_per_read=16,
+                     shared=False):
+        """Start acquiring continuously in a background thread.
+
+        Decoded samples are written into self.stream, a RingBuffer
+        holding the last buffer_duration seconds of samples with the
+        same dtype as acquire_data(). Consumers use latest(), read_since()
+        and wait() of self.stream, which never block the reader thread.
+        If shared is True, the buffers are SharedRingBuffers which can
+        be read by forked processes. Fork them after create_stream(),
+        whose buffers are then used instead, and before this call.
+
+        The de-jittered timestamp of every sample is written with the
+        same sequence number into self.timestamps, see SampleClock.
+        """
+        if self._stream_thread:
+            raise EPOCError("Stream is already started.")
+
+        if not self._stream_created:
+            self.create_stream(buffer_duration, shared)
+        self._stream_created = False
+        self.clock.reset()
+        self._last_eeg_counter = None
+        self._stream_stop.clear()
+        self._stream_error = None
+        self._stream_thread = threading.Thread(target=self._stream_reader,
+                                               args=(packets_per_read,))
+        self._stream_thread.daemon = True
+        self._stream_thread.start()
+
+    def _stream_reader(self, packets_per_read):
+        """Reader thread of start_stream()."""
+        while not self._stream_stop.is_set():
+            try:
+                frames = self.read_block(packets_per_read, timeout=1000)
+            except EPOCTurnedOffError:
+                # Keep waiting for the headset
+                continue
+            except EPOCError as epoc_error:
+                self._stream_error = epoc_error
+                return
+
+            decoded = self.decode_packets(frames)
+            self.update_status(decoded)
+            samples = self.get_samples(decoded)
+
+            # Timestamps are written first as the stream publishes samples
+            self.timestamps.write(self.clock.update(samples["counter"],
+                                                    self.read_time))
+            self.stream.write(samples)
+
+    def aiter_blocks(self, maxsize=16, drop=False, packets_per_read=16):
+        """Return an async iterator of (samples, timestamps) blocks for
+        asyncio, see aio.AsyncEPOC. Requires Python 3."""
+        if self._async is None:
+            from .aio import AsyncEPOC
+            self._async = AsyncEPOC(self, packets_per_read)
+        return self._async.aiter_blocks(maxsize, drop)
+
+    def stop_stream(self):
+        """Stop the background acquisition. The buffer is kept."""
+        if not self._stream_thread:
+            return
+        self._stream_stop.set()
+        self._stream_thread.join()
+        self._stream_thread = None
+        if self._stream_error:
+            raise self._stream_error
+
+    def start_capture(self, filename, index_interval=1.0):
+        """Append every packet read from now on to a capture file.
+
+        Packets are stored encrypted as they come from the USB endpoint,
+        see the capture module. Play them back with method="replay" or
+        read them with capture.CaptureReader.
+        """
+        self.stop_capture()
+        self._capture = capture.CaptureWriter(filename, self, index_interval)
+
+    def stop_capture(self):
+        """Stop capturing and close the capture file."""
+        if self._capture:
+            self._capture.close()
+            self._capture = None
+
+    def is_streaming(self):
+        """Return True if the background acquisition is running."""
+        return self._stream_thread is not None
+
+    def check_stream(self):
+        """Raise the error which stopped the background acquisition if
+        any."""
+        if self._stream_error:
+            raise self._stream_error
+
+    def latest(self, n):
+        """Return a view of the last n streamed samples."""
+        return self.stream.latest(n)
+
+    def read_since(self, seq, n=None):
+        """Return a view of the samples streamed since seq and the
+        sequence number following them."""
+        return self.stream.read_since(seq, n)
+
+    def get_sampling_rate(self):
+        """Return the sampling rate estimated from the arrival times."""
+        return self.clock.rate
 
     def get_quality(self, electrode):
         "Return contact quality for the specified electrode."""
@@ -400,12 +705,16 @@ class EPOC(object):
 
     def disconnect(self):
         """Release the claimed interface."""
-        if self.method == "libusb":
-            for interf in self.device.get_active_configuration():
-                usb.util.release_interface(
-                    self.device, interf.bInterfaceNumber)
-        else:
-            self.endpoint.close()
+        try:
+            self.stop_stream()
+            self.stop_capture()
+        finally:
+            if self.method == "libusb":
+                for interf in self.device.get_active_configuration():
+                    usb.util.release_interface(
+                        self.device, interf.bInterfaceNumber)
+            else:
+                self.endpoint.close()
 
 
 def main():
@@ -421,16 +730,16 @@ def main():
                 print("\x1b[2J\x1b[H")
                 header = "Emotiv Data Packet [%3d/128] [Loss: N/A] [Battery: %2d(%%)]" % (
                     e.counter, e.battery)
-                print "%s\n%s" % (header, '-'*len(header))
+                print("%s\n%s" % (header, '-'*len(header)))
 
-                print "%10s: %5d" % ("Gyro(x)", e.gyroX)
-                print "%10s: %5d" % ("Gyro(y)", e.gyroY)
+                print("%10s: %5d" % ("Gyro(x)", e.gyroX))
+                print("%10s: %5d" % ("Gyro(y)", e.gyroY))
 
                 for i,channel in enumerate(e.channel_mask):
-                    print "%10s: %.2f %20s: %.2f" % (channel, data[i], "Quality", e.quality[channel])
-        except EPOCTurnedOffError, ete:
-            print ete
-        except KeyboardInterrupt, ki:
+                    print("%10s: %.2f %20s: %.2f" % (channel, data[i], "Quality", e.quality[channel]))
+        except EPOCTurnedOffError as ete:
+            print(ete)
+        except KeyboardInterrupt as ki:
             e.disconnect()
             return 0
 
@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+# vim:set et ts=4 sw=4:
+#
+## Copyright (C) 2013 Ozan Çağlayan <ocaglayan@gsu.edu.tr>
+##
+## This program is free software; you can redistribute it and/or modify
+## it under the terms of the GNU General Public License as published by
+## the Free Software Foundation; either version 2 of the License, or
+## (at your option) any later version.
+
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+## GNU General Public License for more details.
+
+## You should have received a copy of the GNU General Public License
+## along with this program; if not, write to the Free Software
+## Foundation, Inc., 675 Mass Ave, Cambridge, MA 02139, USA.
+
+"""\
+This module provides the LSLBridge class which streams EPOC data to
+labstreaminglayer outlets in chunks.
+"""
+
+import numpy as np
+
+try:
+    import pylsl
+except ImportError:
+    pylsl = None
+
+from . import utils
+
+
+class LSLBridge(object):
+    """Push the background stream of an EPOC to LSL outlets.
+
+    Samples are pushed chunk_size at a time with their de-jittered
+    timestamps: smaller chunks lower the latency, larger ones lower the
+    CPU cost. If aux is True, gyro, battery and contact qualities are
+    published as a second stream with the same timestamps.
+    """
+
+    def __init__(self, headset, chunk_size=16, aux=True):
+        if pylsl is None:
+            raise ImportError("pylsl is required to stream to LSL.")
+
+        self.headset = headset
+        self.chunk_size = chunk_size
+        self.running = False
+
+        source_id = str(headset.serial_number)
+        channels = headset.channel_mask
+
+        info = pylsl.StreamInfo("Emotiv EEG", "EEG", len(channels),
+                                headset.sampling_rate, "float32", source_id)
+        desc = info.desc()
+        desc.append_child_value("manufacturer", "Emotiv")
+        desc_channels = desc.append_child("channels")
+        for ch in channels:
+            desc_channels.append_child("channel") \
+                .append_child_value("label", ch) \
+                .append_child_value("unit", "microvolts") \
+                .append_child_value("type", "EEG")
+        self.eeg_outlet = pylsl.StreamOutlet(info, chunk_size)
+
+        self.aux_outlet = None
+        if aux:
+            # Gyro, battery and one contact quality per channel
+            self.aux_labels = ["GyroX", "GyroY", "Battery"] + \
+                ["%s-Quality" % ch for ch in channels]
+            info = pylsl.StreamInfo("Emotiv Aux", "Aux", len(self.aux_labels),
+                                    headset.sampling_rate, "float32",
+                                    source_id + "-aux")
+            desc_channels = info.desc().append_child("channels")
+            for label in self.aux_labels:
+                desc_channels.append_child("channel") \
+                    .append_child_value("label", label)
+            self.aux_outlet = pylsl.StreamOutlet(info, chunk_size)
+
+    def push(self, seq):
+        """Push the samples streamed since seq, at most chunk_size of
+        them. Returns the sequence number following the pushed ones.
+
+        If the bridge fell behind by more than the buffer, the samples
+        pushed start at the oldest one available.
+        """
+        samples, end_seq = self.headset.read_since(seq, self.chunk_size)
+        if not samples.size:
+            return end_seq
+
+        # seq may have been clamped, read the timestamps of the same rows
+        start = end_seq - samples.size
+        timestamps = self.headset.timestamps.read_since(start, samples.size)[0]
+        timestamps = timestamps.tolist()
+
+        eeg = utils.get_microvolts(samples, self.headset.vres) \
+            .astype(np.float32)
+        aux = None
+        if self.aux_outlet:
+            aux = np.empty((samples.size, len(self.aux_labels)),
+                           dtype=np.float32)
+            aux[:, 0] = samples["gyroX"]
+            aux[:, 1] = samples["gyroY"]
+            aux[:, 2] = self.headset.battery
+            aux[:, 3:] = [self.headset.quality[ch]
+                          for ch in self.headset.channel_mask]
+
+        # The views may have been overwritten while copying them, the
+        # next push starts again from the oldest rows available
+        if not (self.headset.stream.is_valid(start) and
+                self.headset.timestamps.is_valid(start)):
+            return start
+
+        self.eeg_outlet.push_chunk(eeg, timestamps)
+        if aux is not None:
+            self.aux_outlet.push_chunk(aux, timestamps)
+        return end_seq
+
+    def run(self):
+        """Stream until stop() is called. Raises the error which
+        stopped the background acquisition if any."""
+        if not self.headset.is_streaming():
+            self.headset.start_stream()
+
+        self.running = True
+        seq = self.headset.stream.seq
+        while self.running:
+            # Sleep until a chunk is ready without polling the headset
+            self.headset.stream.wait(seq + self.chunk_size, timeout=1.0)
+            seq = self.push(seq)
+            self.headset.check_stream()
+
+    def stop(self):
+        """Make run() return after the current chunk."""
+        self.running = False
@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+# vim:set et ts=4 sw=4:
+#
+## Copyright (C) 2013 Ozan Çağlayan <ocaglayan@gsu.edu.tr>
+##
+## This program is free software; you can redistribute it and/or modify
+## it under the terms of the GNU General Public License as published by
+## the Free Software Foundation; either version 2 of the License, or
+## (at your option) any later version.
+
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+## GNU General Public License for more details.
+
+## You should have received a copy of the GNU General Public License
+## along with this program; if not, write to the Free Software
+## Foundation, Inc., 675 Mass Ave, Cambridge, MA 02139, USA.
+
+"""\
+This module provides the Montage class which derives new signals as
+weighted sums of channels, e.g. bipolar or re-referenced channels.
+"""
+
+import numpy as np
+
+
+class Montage(object):
+    """Named derivations of a set of channels.
+
+    Each derivation is a row of weights over the channels. Derivations
+    are added with channel(), bipolar(), common_average(), laplacian()
+    or add() for any weights, all of which return the montage so they
+    can be chained:
+
+        montage = Montage(["O1", "O2", "P7", "P8"])
+        montage.channel("O1").bipolar("O1", "O2").common_average("O2")
+
+    Channel names are case insensitive. apply() computes all the
+    derivations of a block with one matrix product, their rows follow
+    labels.
+    """
+
+    def __init__(self, channels):
+        self.channels = list(channels)
+        self.labels = []
+        self._index = dict((ch.upper(), i) for i, ch in enumerate(channels))
+        self._rows = []
+        self._matrix = None
+
+    @classmethod
+    def from_labels(cls, channels, labels, average=None):
+        """Return the montage of labels like 'O1', 'O1-O2' or 'O1-avg'.
+
+        'avg' is the common average of the average channels, all of
+        them by default.
+        """
+        montage = cls(channels)
+        for label in labels:
+            names = label.split("-")
+            if len(names) == 1:
+                montage.channel(names[0], label)
+            elif names[1].lower() == "avg":
+                montage.common_average(names[0], average, label)
+            else:
+                montage.bipolar(names[0], names[1], label)
+        return montage
+
+    def __len__(self):
+        return len(self.labels)
+
+    def _weights(self, weights):
+        row = np.zeros(len(self.channels))
+        for name, weight in weights:
+            try:
+                row[self._index[name.upper()]] += weight
+            except KeyError:
+                raise ValueError("Unknown channel %s." % name)
+        return row
+
+    def add(self, label, weights):
+        """Add a derivation from a dict of channel weights or a weight
+        per channel."""
+        if isinstance(weights, dict):
+            row = self._weights(weights.items())
+        else:
+            row = np.array(weights, dtype=np.float64)
+            if row.shape != (len(self.channels),):
+                raise ValueError("Expected %d weights." % len(self.channels))
+        self.labels.append(label)
+        self._rows.append(row)
+        self._matrix = None
+        return self
+
+    def channel(self, name, label=None):
+        """Add a channel as is."""
+        return self.add(label or name, {name: 1.0})
+
+    def bipolar(self, first, second, label=None):
+        """Add the difference of two channels."""
+        return self.add(label or "%s-%s" % (first, second),
+                        self._weights([(first, 1.0), (second, -1.0)]))
+
+    def common_average(self, name, reference=None, label=None):
+        """Add a channel minus the average of the reference channels,
+        all of them by default."""
+        reference = self.channels if reference is None else reference
+        weights = [(name, 1.0)] + [(ch, -1.0 / len(reference))
+                                   for ch in reference]
+        return self.add(label or "%s-avg" % name, self._weights(weights))
+
+    def laplacian(self, name, neighbours, label=None):
+        """Add a channel minus the average of its neighbours."""
+        weights = [(name, 1.0)] + [(ch, -1.0 / len(neighbours))
+                                   for ch in neighbours]
+        return self.add(label or "%s-lap" % name, self._weights(weights))
+
+    def index(self, label):
+        """Return the row of a derivation."""
+        return self.labels.index(label)
+
+    @property
+    def matrix(self):
+        """The (derivations x channels) weights."""
+        if self._matrix is None:
+            self._matrix = np.array(self._rows).reshape(
+                len(self._rows), len(self.channels))
+        return self._matrix
+
+    def apply(self, data, axis=0):
+        """Return the derivations of data, whose channels are along
+        axis, (channels x samples) by default. Pass axis=-1 for
+        (samples x channels) blocks of a stream."""
+        data = np.asarray(data)
+        if data.shape[axis] != len(self.channels):
+            raise ValueError("Expected %d channels along axis %d, got %d." %
+                             (len(self.channels), axis, data.shape[axis]))
+        out = np.tensordot(self.matrix, data, axes=([1], [axis]))
+        return np.moveaxis(out, 0, axis)
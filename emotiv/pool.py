@@ -0,0 +1,199 @@
+# -*- coding: utf-8 -*-
+# vim:set et ts=4 sw=4:
+#
+## Copyright (C) 2013 Ozan Çağlayan <ocaglayan@gsu.edu.tr>
+##
+## This program is free software; you can redistribute it and/or modify
+## it under the terms of the GNU General Public License as published by
+## the Free Software Foundation; either version 2 of the License, or
+## (at your option) any later version.
+
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+## GNU General Public License for more details.
+
+## You should have received a copy of the GNU General Public License
+## along with this program; if not, write to the Free Software
+## Foundation, Inc., 675 Mass Ave, Cambridge, MA 02139, USA.
+
+"""\
+This module provides the HeadsetPool class which acquires from
+several headsets in one process.
+"""
+
+import time
+import math
+
+import numpy as np
+
+from . import utils
+from .epoc import EPOC, EPOCError
+from .timing import local_clock
+
+
+class HeadsetPool(object):
+    """Acquire from several headsets on a common timeline.
+
+    Every plugged dongle is opened, or only the ones with the given
+    serial numbers. start() runs the background stream of each headset
+    in its own reader thread. Each stream is available as is through
+    headsets, streams are also aligned on a common grid of host times
+    sampled at the sampling rate, starting when start() is called:
+    read_since() and latest() return merged blocks of (samples x
+    headsets x channels) in uV.
+
+    Samples are aligned using their de-jittered timestamps, see
+    SampleClock, and the nearest sample of each headset is taken for
+    each grid point. Grid points with no sample within half a sampling
+    period, e.g. after lost packets, are NaN for that headset.
+    """
+
+    # Seconds of samples read around the grid points by _align()
+    ALIGN_MARGIN = 0.5
+
+    def __init__(self, serial_numbers=None, channel_mask=None, headsets=None,
+                 **kwargs):
+        if headsets is None:
+            if serial_numbers is None:
+                serial_numbers = EPOC.get_serial_numbers()
+            if not serial_numbers:
+                raise EPOCError("No Emotiv EPOC found.")
+            headsets = [EPOC(serial_number=sn, **kwargs)
+                        for sn in serial_numbers]
+        self.headsets = list(headsets)
+        self.serial_numbers = [h.serial_number for h in self.headsets]
+
+        if channel_mask:
+            for headset in self.headsets:
+                headset.set_channel_mask(channel_mask)
+        self.channel_mask = self.headsets[0].channel_mask
+        self.sampling_rate = self.headsets[0].sampling_rate
+        self.start_time = None
+
+    def __len__(self):
+        return len(self.headsets)
+
+    def __getitem__(self, serial_number):
+        """Return the headset with the given serial number."""
+        return self.headsets[self.serial_numbers.index(serial_number)]
+
+    def start(self, buffer_duration=60, packets_per_read=16, shared=False):
+        """Start the streams of all headsets, see EPOC.start_stream()."""
+        for headset in self.headsets:
+            headset.start_stream(buffer_duration, packets_per_read, shared)
+        self.start_time = local_clock()
+
+    def stop(self):
+        """Stop the streams of all headsets."""
+        errors = []
+        for headset in self.headsets:
+            try:
+                headset.stop_stream()
+            except EPOCError as e:
+                errors.append(e)
+        if errors:
+            raise errors[0]
+
+    def disconnect(self):
+        for headset in self.headsets:
+            headset.disconnect()
+
+    @property
+    def seq(self):
+        """Number of grid points available in all the streams."""
+        if self.start_time is None:
+            raise EPOCError("Pool is not started, call start() first.")
+        last_times = [self._last_time(h) for h in self.headsets]
+        if None in last_times or min(last_times) < self.start_time:
+            return 0
+        return int(math.floor((min(last_times) - self.start_time) *
+                              self.sampling_rate)) + 1
+
+    def _last_time(self, headset):
+        end_seq = headset.stream.seq
+        if not end_seq:
+            return None
+        return headset.timestamps.read_since(end_seq - 1, 1)[0][0]
+
+    def _align(self, headset, times):
+        """Return the samples of headset nearest to times in uV."""
+        # Samples are published after their timestamps, so read the
+        # same sequence range of both
+        end_seq = headset.stream.seq
+        n = min(end_seq, headset.stream.capacity)
+        stamps = headset.timestamps.read_since(end_seq - n, n)[0]
+        samples = headset.stream.read_since(end_seq - n, n)[0]
+
+        out = np.empty((times.size, len(self.channel_mask)))
+        out.fill(np.nan)
+        if not n or not times.size:
+            return out
+
+        # Only the samples within ALIGN_MARGIN of times are aligned.
+        # The timestamps are almost sorted, refits of the SampleClock
+        # step them back by much less than the margin.
+        lo = max(np.searchsorted(stamps, times[0] - self.ALIGN_MARGIN) - 1, 0)
+        hi = np.searchsorted(stamps, times[-1] + self.ALIGN_MARGIN) + 1
+        # Keep the timestamps non-decreasing for the binary search
+        window = np.maximum.accumulate(stamps[lo:hi])
+        m = window.size
+
+        # Nearest timestamp of each grid point
+        idx = np.clip(np.searchsorted(window, times), 1, m - 1) if m > 1 \
+            else np.zeros(times.size, dtype=np.intp)
+        if m > 1:
+            before = times - window[idx - 1] < window[idx] - times
+            idx[before] -= 1
+        close = np.abs(window[idx] - times) <= 0.5 / self.sampling_rate
+        out[close] = utils.get_microvolts(samples[lo + idx[close]],
+                                          headset.vres)
+
+        # The views may have been overwritten while aligning
+        if not headset.stream.is_valid(end_seq - n + lo):
+            raise EPOCError("Stream of %s overran while aligning." %
+                            headset.serial_number)
+        return out
+
+    def get_times(self, seq, end_seq):
+        """Return the host times of the grid points seq to end_seq."""
+        return self.start_time + np.arange(seq, end_seq) / \
+            float(self.sampling_rate)
+
+    def read_since(self, seq, n=None):
+        """Return the times and the merged block of the grid points
+        since seq, at most n of them, and the following grid point."""
+        end_seq = self.seq
+        if n is not None:
+            end_seq = min(end_seq, seq + n)
+        seq = min(seq, end_seq)
+        times = self.get_times(seq, end_seq)
+        block = np.empty((times.size, len(self.headsets),
+                          len(self.channel_mask)))
+        for i, headset in enumerate(self.headsets):
+            block[:, i] = self._align(headset, times)
+        return times, block, end_seq
+
+    def latest(self, n):
+        """Return the times and the merged block of the last n grid
+        points."""
+        end_seq = self.seq
+        times, block, end_seq = self.read_since(max(end_seq - n, 0), n)
+        return times, block
+
+    def wait(self, seq, timeout=None):
+        """Block until grid point seq - 1 is available in all streams.
+
+        Returns the current grid point which is less than seq if
+        timeout seconds elapsed before.
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        while self.seq < seq:
+            remaining = None if deadline is None else deadline - time.time()
+            if remaining is not None and remaining <= 0:
+                break
+            # Wait for the next block of the headset which is behind
+            late = min(self.headsets,
+                       key=lambda h: self._last_time(h) or -np.inf)
+            late.stream.wait(late.stream.seq + 1, remaining)
+        return self.seq
@@ -0,0 +1,183 @@
+# -*- coding: utf-8 -*-
+# vim:set et ts=4 sw=4:
+#
+## Copyright (C) 2013 Ozan Çağlayan <ocaglayan@gsu.edu.tr>
+##
+## This program is free software; you can redistribute it and/or modify
+## it under the terms of the GNU General Public License as published by
+## the Free Software Foundation; either version 2 of the License, or
+## (at your option) any later version.
+
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+## GNU General Public License for more details.
+
+## You should have received a copy of the GNU General Public License
+## along with this program; if not, write to the Free Software
+## Foundation, Inc., 675 Mass Ave, Cambridge, MA 02139, USA.
+
+"""\
+This module provides the ReplayEndpoint class which plays recorded
+sessions and raw captures back as encrypted EPOC packets.
+"""
+
+import time
+
+import numpy as np
+
+import usb.core
+
+from . import utils
+from . import capture
+from .storage import Recording
+
+# Serial number used to encrypt packets replayed from decoded recordings
+SERIAL_NUMBER = "SN000000000000RP"
+
+
+# Units of the levels of a recording
+UNITS = ("uV", "raw")
+
+
+def load_matlab(filename):
+    """Load a FieldTrip-style recording saved by save_as_matlab() or
+    SessionWriter.
+
+    Returns the channel labels, an (N x channels) array of levels with
+    all trials concatenated, the counters if the file has a CTR
+    variable or None, the battery percentage or None and the unit of
+    the levels stored in the file, or None for files written before
+    the unit was stored.
+    """
+    recording = Recording(filename)
+    labels = recording.channels
+    trials = np.hstack(list(recording.trials())).T
+
+    counters = recording.counters()
+
+    battery = None
+    if "battery" in recording.metadata:
+        battery = int(recording.metadata["battery"])
+
+    return labels, trials, counters, battery, recording.unit
+
+
+class ReplayEndpoint(object):
+    """File-like endpoint producing the packets of a recording.
+
+    The packets of a capture file are returned as they were captured.
+    The samples of a MAT file are encoded and encrypted exactly as a
+    headset does for the channels and the cipher of the given EPOC,
+    with a battery packet after each counter 127. The levels of a MAT
+    file are in the unit it stores, or in unit, "uV" or "raw", which is
+    required for files written before the unit was stored. Packets are
+    returned at speed times the sampling rate, or as fast as possible
+    if speed is None or 0. When the recording ends, reads wait a second
+    and raise the USB timeout error like a turned off headset unless
+    loop is True.
+    """
+
+    def __init__(self, headset, filename, speed=1.0, loop=False, unit=None):
+        self.speed = speed
+        self.loop = loop
+        self.sampling_rate = headset.sampling_rate
+
+        if capture.is_capture(filename):
+            self._packets = capture.CaptureReader(filename).packets.ravel()
+        else:
+            self._packets = self._encode_matlab(headset, filename, unit)
+
+        self._pos = 0
+        self._start = None
+
+    def _encode_matlab(self, headset, filename, unit=None):
+        """Return the encrypted packets of a MAT file."""
+        labels, samples, counters, battery, file_unit = load_matlab(filename)
+
+        unit = unit or file_unit
+        if unit is None:
+            raise ValueError("%s doesn't store the unit of its levels, "
+                             "give it as unit (replay_unit of EPOC): %s." %
+                             (filename, " or ".join(UNITS)))
+        if unit not in UNITS:
+            raise ValueError("Unknown unit %s, expected %s." %
+                             (unit, " or ".join(UNITS)))
+
+        levels = samples / headset.vres if unit == "uV" else samples
+        levels = np.clip(np.round(levels), 0, 16383).astype(np.uint16)
+
+        if counters is None:
+            counters = np.arange(levels.shape[0]) % 128
+
+        # Battery percentage back to a battery packet counter
+        battery_counter = 255
+        if battery is not None:
+            battery_counter = min(k for k, v in headset.battery_levels.items()
+                                  if v >= battery)
+
+        # Insert a battery packet after every counter 127
+        after = np.flatnonzero(counters == 127) + 1
+        position = np.arange(counters.size) + \
+            np.searchsorted(after, np.arange(counters.size), side="right")
+        n_packets = counters.size + after.size
+        all_counters = np.empty(n_packets, dtype=np.uint8)
+        all_counters.fill(battery_counter)
+        all_counters[position] = counters
+
+        # Contact quality bits overlap with O1, so they're written first
+        # with a constant quality of about 1. Channels missing in the
+        # recording stay at zero.
+        channel_levels = np.zeros((n_packets, len(headset.channels) + 1),
+                                  dtype=np.uint16)
+        channel_levels[position, 0] = int(round(540 / headset.vres))
+        for i, ch in enumerate(headset.channels):
+            if ch in labels:
+                channel_levels[position, i + 1] = levels[:, labels.index(ch)]
+
+        table = utils.get_level_table(
+            [headset.bit_indexes["QU"]] +
+            [headset.bit_indexes[ch] for ch in headset.channels])
+        frames = utils.set_levels(all_counters, channel_levels, table)
+        return np.frombuffer(headset._cipher.encrypt(frames.tobytes()),
+                             dtype=np.uint8)
+
+    def _wait(self, n_bytes):
+        """Pace the playback until the next n_bytes can be returned."""
+        if not self.speed:
+            return
+        now = time.time()
+        if self._start is None:
+            self._start = now
+        due = self._start + (self._pos + n_bytes) / 32.0 / \
+            (self.sampling_rate * self.speed)
+        if due > now:
+            time.sleep(due - now)
+
+    def read(self, size, timeout=None):
+        """Return the next size bytes of packets."""
+        return self._read(size).tobytes()
+
+    def _read(self, size):
+        """Return a view of the next size bytes of packets."""
+        size -= size % 32
+        if self._pos >= self._packets.size:
+            if not self.loop:
+                time.sleep(1)
+                raise usb.core.USBError("Replay finished", errno=110)
+            self._pos = 0
+            self._start = None
+
+        data = self._packets[self._pos:self._pos + size]
+        self._wait(data.size)
+        self._pos += data.size
+        return data
+
+    def readinto(self, buf):
+        """Read the next packets into buf, return the byte count."""
+        data = self._read(len(buf))
+        np.frombuffer(buf, dtype=np.uint8)[:data.size] = data
+        return data.size
+
+    def close(self):
+        self._packets = np.zeros((0,), dtype=np.uint8)
@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+# vim:set et ts=4 sw=4:
+#
+## Copyright (C) 2012 Ozan Çağlayan <ocaglayan@gsu.edu.tr>
+##
+## This program is free software; you can redistribute it and/or modify
+## it under the terms of the GNU General Public License as published by
+## the Free Software Foundation; either version 2 of the License, or
+## (at your option) any later version.
+
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+## GNU General Public License for more details.
+
+## You should have received a copy of the GNU General Public License
+## along with this program; if not, write to the Free Software
+## Foundation, Inc., 675 Mass Ave, Cambridge, MA 02139, USA.
+
+"""\
+This module provides fixed-size ring buffers for continuous acquisition.
+"""
+
+import time
+import ctypes
+import threading
+import multiprocessing
+
+import numpy as np
+
+
+class RingBuffer(object):
+    """Preallocated buffer keeping the last capacity rows written to it.
+
+    Every row is stored twice, capacity rows apart, so that any window
+    of the last capacity rows is a contiguous view into the buffer.
+    There may be a single writer thread, readers never take a lock.
+
+    Rows are addressed with sequence numbers counting all the rows
+    written since the creation of the buffer. A returned view stays
+    valid until capacity more rows are written, copy it if it has to
+    live longer than that or check is_valid() after using it.
+    """
+
+    def __init__(self, capacity, shape=(), dtype=np.float64):
+        self.capacity = capacity
+        self._data = np.zeros((2 * capacity,) + tuple(shape), dtype=dtype)
+        self._cond = threading.Condition()
+
+        # Sequence number of the next row to be written
+        self.seq = 0
+
+        # Sequence number following the rows being written
+        self.head = 0
+
+    def write(self, rows):
+        """Append rows to the buffer."""
+        n_rows = len(rows)
+        if n_rows > self.capacity:
+            rows = rows[-self.capacity:]
+
+        cap = self.capacity
+        start = (self.seq + n_rows - len(rows)) % cap
+        end = start + len(rows)
+        self.head = self.seq + n_rows
+
+        # First copy never wraps as start < capacity
+        self._data[start:end] = rows
+
+        # Mirror copy wraps around the end of the buffer
+        if end <= cap:
+            self._data[start + cap:end + cap] = rows
+        else:
+            self._data[start + cap:] = rows[:cap - start]
+            self._data[:end - cap] = rows[cap - start:]
+
+        # Publish the new rows only after they're in place
+        self.seq += n_rows
+        with self._cond:
+            self._cond.notify_all()
+
+    def _window(self, seq, end_seq):
+        """Return the view of rows from seq to end_seq."""
+        end = end_seq % self.capacity
+        if end < end_seq - seq:
+            end += self.capacity
+        return self._data[end - (end_seq - seq):end]
+
+    def latest(self, n):
+        """Return a view of the last n rows."""
+        end_seq = self.seq
+        n = min(n, end_seq, self.capacity)
+        return self._window(end_seq - n, end_seq)
+
+    def read_since(self, seq, n=None):
+        """Return a view of the rows written since seq and the sequence
+        number following them. At most n rows are returned if given.
+
+        If the reader fell behind by more than capacity rows, the oldest
+        rows are lost and the view starts at the oldest row available.
+        """
+        end_seq = self.seq
+        seq = max(seq, end_seq - self.capacity, 0)
+        if n is not None:
+            end_seq = min(end_seq, seq + n)
+        return self._window(seq, end_seq), end_seq
+
+    def is_valid(self, seq):
+        """Return True if no row from seq on was overwritten. Check it
+        after using a view to know that it wasn't modified meanwhile."""
+        return self.head - seq <= self.capacity
+
+    def wait(self, seq, timeout=None):
+        """Block until the row with sequence number seq - 1 is written.
+
+        Returns the current sequence number which is less than seq if
+        timeout seconds elapsed before.
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        with self._cond:
+            while self.seq < seq:
+                if deadline is None:
+                    self._cond.wait()
+                elif deadline > time.time():
+                    self._cond.wait(deadline - time.time())
+                else:
+                    break
+        return self.seq
+
+
+class SharedRingBuffer(RingBuffer):
+    """RingBuffer in shared memory, to be read by other processes.
+
+    The rows, the sequence numbers and the condition notified on writes
+    are shared with the processes forked after the creation of the
+    buffer, e.g. by passing it to multiprocessing.Process. There may be
+    a single writer, in any of the processes, and any number of readers
+    which get views of the shared memory without any copy or pickling.
+    Readers which fall behind don't slow the writer down, they should
+    check is_valid() after using a view.
+    """
+
+    def __init__(self, capacity, shape=(), dtype=np.float64):
+        self.capacity = capacity
+        shape = (2 * capacity,) + tuple(shape)
+        dtype = np.dtype(dtype)
+        n_bytes = int(np.prod(shape)) * dtype.itemsize
+        self._raw = multiprocessing.RawArray(ctypes.c_ubyte, n_bytes)
+        self._data = np.frombuffer(self._raw, dtype=dtype).reshape(shape)
+        self._cond = multiprocessing.Condition()
+
+        # Native longs are written atomically on 32-bit ARM too
+        self._seq = multiprocessing.RawValue(ctypes.c_long, 0)
+        self._head = multiprocessing.RawValue(ctypes.c_long, 0)
+
+    @property
+    def seq(self):
+        return self._seq.value
+
+    @seq.setter
+    def seq(self, value):
+        self._seq.value = value
+
+    @property
+    def head(self):
+        return self._head.value
+
+    @head.setter
+    def head(self, value):
+        self._head.value = value
@@ -0,0 +1,446 @@
+# -*- coding: utf-8 -*-
+# vim:set et ts=4 sw=4:
+#
+## Copyright (C) 2013 Ozan Çağlayan <ocaglayan@gsu.edu.tr>
+##
+## This program is free software; you can redistribute it and/or modify
+## it under the terms of the GNU General Public License as published by
+## the Free Software Foundation; either version 2 of the License, or
+## (at your option) any later version.
+
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+## GNU General Public License for more details.
+
+## You should have received a copy of the GNU General Public License
+## along with this program; if not, write to the Free Software
+## Foundation, Inc., 675 Mass Ave, Cambridge, MA 02139, USA.
+
+"""\
+This module provides the SessionWriter class which writes recordings
+incrementally into MATLAB 7.3 (HDF5) files with the FieldTrip layout,
+and the Recording class which reads recordings lazily.
+"""
+
+import time
+
+import numpy as np
+from scipy.io import loadmat, whosmat
+
+try:
+    import h5py
+except ImportError:
+    h5py = None
+
+from . import utils
+from . import capture
+
+# MAT 7.3 files are HDF5 files with a MATLAB header in the user block
+MAT_USERBLOCK_SIZE = 512
+
+
+def _mat_header():
+    """Return the 128 bytes header of MAT 7.3 files."""
+    text = "MATLAB 7.3 MAT-file, Platform: GLNXA64, " \
+           "Created on: %s HDF5 schema 1.00 ." % \
+           time.strftime("%a %b %d %H:%M:%S %Y")
+    return (text.ljust(116) + "\x00" * 8 + "\x00\x02IM").encode("ascii")
+
+
+def _set_class(node, matlab_class):
+    node.attrs["MATLAB_class"] = np.bytes_(matlab_class)
+
+
+class SessionWriter(object):
+    """Append acquired blocks to a MAT 7.3 file as they arrive.
+
+    The file holds a FieldTrip raw data structure named data with
+    label, fsample, trial, time and sampleinfo, and the packet
+    counters of every trial in data.counter. Trials are stored in
+    chunked, compressed datasets which grow with every append(), so
+    memory stays flat however long the session is. The file is flushed
+    every flush_interval seconds. It can be read by MATLAB, FieldTrip,
+    h5py and storage.Recording.
+    """
+
+    def __init__(self, filename, channel_mask, fsample=128.0,
+                 metadata=None, chunk_samples=1280, compression="gzip",
+                 flush_interval=10.0):
+        if h5py is None:
+            raise ImportError("h5py is required to write MAT 7.3 files.")
+
+        self.filename = filename
+        self.channel_mask = list(channel_mask)
+        self.fsample = float(fsample)
+        self.chunk_samples = chunk_samples
+        self.compression = compression
+        self.flush_interval = flush_interval
+
+        self._file = h5py.File(filename, "w",
+                               userblock_size=MAT_USERBLOCK_SIZE)
+        self._refs = self._file.create_group("#refs#")
+        self._data = self._file.create_group("data")
+        _set_class(self._data, "struct")
+
+        self._write_scalar(self._data, "fsample", self.fsample)
+        self._write_cell(self._data, "label",
+                         [self._write_string(self._refs, "label%d" % i, ch)
+                          for i, ch in enumerate(self.channel_mask)])
+
+        # Cells growing with each trial
+        for name in ("trial", "time", "counter"):
+            self._write_cell(self._data, name, [], resizable=True)
+        self._sampleinfo = self._data.create_dataset(
+            "sampleinfo", shape=(2, 0), maxshape=(2, None), dtype=np.float64)
+        _set_class(self._sampleinfo, "double")
+
+        self._trial = None
+        self._n_trials = 0
+        self._n_samples = 0
+
+        if metadata:
+            for key, value in metadata.items():
+                self.set_metadata(key, value)
+        # Unit of the trials, see append()
+        self.set_metadata("unit", "uV")
+
+        # Write the MATLAB header, HDF5 never touches the user block
+        self._file.flush()
+        with open(filename, "r+b") as f:
+            f.write(_mat_header())
+        self._last_flush = time.time()
+
+    def _write_scalar(self, group, name, value):
+        dataset = group.create_dataset(name, data=np.array([[value]],
+                                                           dtype=np.float64))
+        _set_class(dataset, "double")
+        return dataset
+
+    def _write_string(self, group, name, value):
+        # Strings are column-major uint16 character arrays
+        chars = np.array([[ord(c) for c in value]], dtype=np.uint16).T
+        if not chars.size:
+            chars = np.zeros((2,), dtype=np.uint64)
+            dataset = group.create_dataset(name, data=chars)
+            dataset.attrs["MATLAB_empty"] = np.uint8(1)
+        else:
+            dataset = group.create_dataset(name, data=chars)
+        _set_class(dataset, "char")
+        dataset.attrs["MATLAB_int_decode"] = np.int32(2)
+        return dataset
+
+    def _write_cell(self, group, name, datasets, resizable=False):
+        refs = group.create_dataset(name, shape=(len(datasets), 1),
+                                    maxshape=(None, 1) if resizable else None,
+                                    dtype=h5py.special_dtype(ref=h5py.Reference))
+        for i, dataset in enumerate(datasets):
+            refs[i, 0] = dataset.ref
+        _set_class(refs, "cell")
+        return refs
+
+    def _append_ref(self, name, dataset):
+        if name not in self._data:
+            self._write_cell(self._data, name, [], resizable=True)
+        refs = self._data[name]
+        refs.resize((refs.shape[0] + 1, 1))
+        refs[-1, 0] = dataset.ref
+
+    def _create_growing(self, name, width, dtype, matlab_class):
+        # MATLAB arrays are column-major: a channels x samples matrix is
+        # a samples x channels dataset, growing along the first axis
+        dataset = self._refs.create_dataset(
+            name, shape=(0, width), maxshape=(None, width), dtype=dtype,
+            chunks=(self.chunk_samples, width),
+            compression=self.compression)
+        _set_class(dataset, matlab_class)
+        return dataset
+
+    def set_metadata(self, key, value):
+        """Store a string or a number as a top level variable."""
+        if key in self._file:
+            del self._file[key]
+        if isinstance(value, utils.string_types):
+            self._write_string(self._file, key, value)
+        elif isinstance(value, (list, tuple)):
+            self._write_cell(self._file, key,
+                             [self._write_string(self._refs,
+                                                 "%s%d" % (key, i), str(v))
+                              for i, v in enumerate(value)])
+        else:
+            self._write_scalar(self._file, key, value)
+
+    def start_trial(self):
+        """Start a new trial, ending the current one if any."""
+        self.end_trial()
+        n = self._n_trials
+        self._trial = {
+            "trial": self._create_growing("trial%d" % n,
+                                          len(self.channel_mask),
+                                          np.float64, "double"),
+            "time": self._create_growing("time%d" % n, 1,
+                                         np.float64, "double"),
+            "counter": self._create_growing("counter%d" % n, 1,
+                                            np.uint8, "uint8"),
+            "start": self._n_samples,
+        }
+        for name in ("trial", "time", "counter"):
+            self._append_ref(name, self._trial[name])
+
+    def append(self, samples, vres=0.51):
+        """Append samples to the current trial.
+
+        samples is either an array of samples with get_sample_dtype() or
+        an (N x channels) array of levels in uV. A trial is started if
+        there's none.
+        """
+        if self._trial is None:
+            self.start_trial()
+
+        if samples.dtype.names:
+            counters = samples["counter"]
+            samples = utils.get_microvolts(samples, vres)
+        else:
+            counters = None
+
+        n = samples.shape[0]
+        trial = self._trial["trial"]
+        start = trial.shape[0]
+        for name in ("trial", "time", "counter"):
+            self._trial[name].resize((start + n, self._trial[name].shape[1]))
+
+        trial[start:] = samples
+        self._trial["time"][start:, 0] = np.arange(start, start + n) / \
+            self.fsample
+        if counters is not None:
+            self._trial["counter"][start:, 0] = counters
+        self._n_samples += n
+
+        if time.time() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    def append_cell(self, name, samples=None, vres=0.51):
+        """Add samples as the next entry of the data.name cell, e.g.
+        the resting data before each trial, or an empty entry if
+        samples is None. samples are as in append().
+        """
+        if name in ("label", "fsample", "trial", "time", "counter",
+                    "sampleinfo"):
+            raise ValueError("data.%s is written by the writer." % name)
+        index = self._data[name].shape[0] if name in self._data else 0
+        dataset_name = "%s%d" % (name, index)
+        if samples is None:
+            dataset = self._refs.create_dataset(
+                dataset_name, data=np.zeros((2,), dtype=np.uint64))
+            dataset.attrs["MATLAB_empty"] = np.uint8(1)
+        else:
+            if samples.dtype.names:
+                samples = utils.get_microvolts(samples, vres)
+            dataset = self._refs.create_dataset(
+                dataset_name, data=np.asarray(samples, dtype=np.float64),
+                compression=self.compression)
+        _set_class(dataset, "double")
+        self._append_ref(name, dataset)
+
+    def end_trial(self):
+        """End the current trial and record its sampleinfo."""
+        if self._trial is None:
+            return
+        self._n_trials += 1
+        self._sampleinfo.resize((2, self._n_trials))
+        # 1-based first and last sample indexes
+        self._sampleinfo[:, -1] = [self._trial["start"] + 1,
+                                   self._n_samples]
+        self._trial = None
+
+    def flush(self):
+        """Flush written blocks to disk."""
+        self._file.flush()
+        self._last_flush = time.time()
+
+    def close(self):
+        self.end_trial()
+        self._file.close()
+
+
+def _matlab_value(value):
+    """Convert a variable read by scipy.io.loadmat to a Python value."""
+    if isinstance(value, np.ndarray):
+        if value.dtype.kind in "US":
+            if not value.size:
+                return ""
+            # Rows are strings, or characters with chars_as_strings=False
+            value = np.atleast_1d(value)
+            rows = ["".join(row.tolist()).strip()
+                    for row in value.reshape(value.shape[0], -1)]
+            return rows[0] if len(rows) == 1 else rows
+        if value.dtype == object:
+            return [_matlab_value(v) for v in value.ravel()]
+        if value.size == 1:
+            return value.item()
+    return value
+
+
+def _hdf5_value(f, node):
+    """Convert a top level dataset of a MAT 7.3 file to a Python value."""
+    matlab_class = node.attrs.get("MATLAB_class", "")
+    if isinstance(matlab_class, bytes):
+        matlab_class = matlab_class.decode()
+    if "MATLAB_empty" in node.attrs:
+        return "" if matlab_class == "char" else []
+    if matlab_class == "char":
+        # Each column is a row of the MATLAB character matrix
+        rows = [column.astype("<u2").tobytes().decode("utf-16-le").strip()
+                for column in np.atleast_2d(node[()].T)]
+        # Python 2 strings are bytes
+        if bytes is str:
+            rows = [row.encode("utf-8") for row in rows]
+        return rows[0] if len(rows) == 1 else rows
+    if matlab_class == "cell":
+        return [_hdf5_value(f, f[ref]) for ref in node[()].ravel()]
+    value = node[()]
+    if value.size == 1:
+        return value.item()
+    return value.T
+
+
+class Recording(object):
+    """Lazy access to the trials of a recording by name.
+
+    MAT files written by save_as_matlab() or scipy.io, MAT 7.3 files
+    written by SessionWriter and capture files are supported. Nothing
+    is read from a MAT 7.3 or a capture file until a trial is sliced,
+    and then only the requested samples and channels are read. MAT
+    files before 7.3 can't be read partially, so their data variable
+    is loaded on first access, separately from the metadata.
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self._metadata = None
+        self._data = None
+
+        if capture.is_capture(filename):
+            self.format = "capture"
+            self._capture = capture.CaptureReader(filename)
+            self.channels = list(self._capture.get_headset().channel_mask)
+            self.fsample = float(self._capture.header["sampling_rate"])
+            self.n_trials = 1
+        elif h5py is not None and h5py.is_hdf5(filename):
+            self.format = "hdf5"
+            self._file = h5py.File(filename, "r")
+            data = self._file["data"]
+            self.channels = [_hdf5_value(self._file, self._file[ref])
+                             for ref in data["label"][()].ravel()]
+            self.fsample = float(data["fsample"][()].item())
+            self.n_trials = data["trial"].shape[0]
+        else:
+            self.format = "mat"
+            self.channels = [str(l.flat[0]).strip()
+                             for l in self._get_data()["label"].flat]
+            self.fsample = float(self._get_data()["fsample"].flat[0])
+            self.n_trials = self._get_data()["trial"].size
+
+    def __len__(self):
+        return self.n_trials
+
+    @property
+    def unit(self):
+        """Unit of the trials, "uV" or "raw" for levels as read from the
+        headset, or None if the file doesn't tell. Older files don't."""
+        if self.format == "capture":
+            return "uV"
+        unit = self.metadata.get("unit")
+        return str(unit).strip() if unit is not None else None
+
+    def _get_data(self):
+        """Return the FieldTrip structure of a MAT file."""
+        if self._data is None:
+            self._data = loadmat(self.filename,
+                                 variable_names=["data"])["data"][0, 0]
+        return self._data
+
+    @property
+    def metadata(self):
+        """Dict of the variables stored next to the data."""
+        if self._metadata is None:
+            if self.format == "capture":
+                self._metadata = dict(self._capture.header)
+            elif self.format == "hdf5":
+                self._metadata = dict(
+                    (str(key), _hdf5_value(self._file, node))
+                    for key, node in self._file.items()
+                    if key not in ("data", "#refs#"))
+            else:
+                names = [name for name, shape, cls in whosmat(self.filename)
+                         if name != "data"]
+                self._metadata = dict(
+                    (key, _matlab_value(value)) for key, value in
+                    loadmat(self.filename, variable_names=names).items()
+                    if not key.startswith("__"))
+        return self._metadata
+
+    def _channel_indexes(self, channels):
+        if channels is None:
+            return list(range(len(self.channels)))
+        return [self.channels.index(ch) for ch in channels]
+
+    def _sample_range(self, start, stop):
+        """Convert start and stop in seconds to sample indexes."""
+        start = int(round(start * self.fsample)) if start is not None \
+            else None
+        stop = int(round(stop * self.fsample)) if stop is not None \
+            else None
+        return start, stop
+
+    def trial(self, index=0, channels=None, start=None, stop=None):
+        """Return a (channels x samples) array of a trial in uV.
+
+        channels is a list of labels, all channels by default. start
+        and stop are in seconds from the beginning of the trial.
+        """
+        chans = self._channel_indexes(channels)
+        first, last = self._sample_range(start, stop)
+
+        if self.format == "capture":
+            header = self._capture.header
+            begin = 0 if start is None else \
+                self._capture.time_to_packet(header["start_clock"] + start)
+            end = None if stop is None else \
+                self._capture.time_to_packet(header["start_clock"] + stop)
+            samples = self._capture.get_samples(begin, end)
+            headset = self._capture.get_headset()
+            return utils.get_microvolts(samples, headset.vres)[:, chans].T
+
+        if self.format == "hdf5":
+            dataset = self._file[self._file["data"]["trial"][index, 0]]
+            # h5py needs increasing indexes
+            order = np.argsort(chans)
+            block = dataset[first:last, sorted(chans)]
+            return block[:, np.argsort(order)].T
+
+        trial = self._get_data()["trial"].flat[index]
+        return trial[chans, first:last]
+
+    def counters(self, index=None):
+        """Return the packet counters of a trial, of all trials if index
+        is None, or None if they're not stored."""
+        if self.format == "capture":
+            return self._capture.get_samples()["counter"]
+        if self.format == "hdf5":
+            refs = self._file["data"]["counter"]
+            indexes = range(self.n_trials) if index is None else [index]
+            return np.hstack([self._file[refs[i, 0]][:, 0] for i in indexes])
+        # save_as_matlab() stores the counters of all trials in CTR
+        if "CTR" in self.metadata and (index is None or self.n_trials == 1):
+            return np.asarray(self.metadata["CTR"]).ravel()
+        return None
+
+    def trials(self, channels=None, start=None, stop=None):
+        """Iterate over all trials, see trial()."""
+        for i in range(self.n_trials):
+            yield self.trial(i, channels, start, stop)
+
+    def close(self):
+        if self.format == "hdf5":
+            self._file.close()
@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+# vim:set et ts=4 sw=4:
+#
+## Copyright (C) 2012 Ozan Çağlayan <ocaglayan@gsu.edu.tr>
+##
+## This program is free software; you can redistribute it and/or modify
+## it under the terms of the GNU General Public License as published by
+## the Free Software Foundation; either version 2 of the License, or
+## (at your option) any later version.
+
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+## GNU General Public License for more details.
+
+## You should have received a copy of the GNU General Public License
+## along with this program; if not, write to the Free Software
+## Foundation, Inc., 675 Mass Ave, Cambridge, MA 02139, USA.
+
+"""\
+This module provides a monotonic host clock and the SampleClock class
+which estimates de-jittered sample timestamps from packet counters.
+"""
+
+import os
+import time
+import ctypes
+import ctypes.util
+
+import numpy as np
+
+
+def _get_local_clock():
+    """Return a function reading a monotonic clock in seconds."""
+    if hasattr(time, "monotonic"):
+        return time.monotonic
+
+    # Python 2 lacks time.monotonic(), use clock_gettime() if available
+    try:
+        librt = ctypes.CDLL(ctypes.util.find_library("rt") or "librt.so.1",
+                            use_errno=True)
+        clock_gettime = librt.clock_gettime
+    except (OSError, AttributeError):
+        return time.time
+
+    class timespec(ctypes.Structure):
+        _fields_ = [("tv_sec", ctypes.c_long), ("tv_nsec", ctypes.c_long)]
+
+    # CLOCK_MONOTONIC is 1 on Linux, which is also what LSL uses
+    CLOCK_MONOTONIC = 1
+    ts = timespec()
+
+    def monotonic():
+        if clock_gettime(CLOCK_MONOTONIC, ctypes.byref(ts)) != 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno))
+        return ts.tv_sec + ts.tv_nsec * 1e-9
+
+    return monotonic
+
+local_clock = _get_local_clock()
+
+
+class SampleClock(object):
+    """Running linear model of host arrival time against packet index.
+
+    Counters are unwrapped into a continuous packet index which also
+    accounts for dropped packets. Every USB transfer provides one
+    observation: the index of its last packet and its arrival time.
+    An exponentially weighted least squares fit of these observations
+    gives a timestamp for every sample free of the USB and scheduling
+    jitter, and the true sampling rate of the headset.
+    """
+
+    def __init__(self, sampling_rate=128, period=128, memory=1000):
+        self.nominal_rate = float(sampling_rate)
+        self.period = period
+
+        # Forgetting factor of the observations
+        self._decay = 1.0 - 1.0 / memory
+
+        self.reset()
+
+    def reset(self):
+        """Forget all observations."""
+        self._last_counter = None
+        self._last_index = 0
+        self._last_time = None
+        self._t0 = None
+
+        # Weighted means and (co)variances of index and time
+        self._weight = 0.0
+        self._mean_x = self._mean_y = 0.0
+        self._cov_xx = self._cov_xy = 0.0
+
+    @property
+    def slope(self):
+        """Estimated seconds per sample."""
+        if self._weight < 2 or self._cov_xx <= 0:
+            return 1.0 / self.nominal_rate
+        return self._cov_xy / self._cov_xx
+
+    @property
+    def rate(self):
+        """Estimated sampling rate in Hz."""
+        return 1.0 / self.slope
+
+    def _unwrap(self, counters, arrival_time):
+        """Return the packet indexes of counters."""
+        if self._last_counter is None:
+            steps = np.empty(counters.size, dtype=np.intp)
+            steps[0] = 0
+            steps[1:] = (np.diff(counters) - 1) % self.period + 1
+            return np.cumsum(steps)
+
+        steps = (np.diff(np.concatenate(([self._last_counter], counters)))
+                 - 1) % self.period + 1
+        indexes = self._last_index + np.cumsum(steps)
+
+        # Drops of period or more packets can only be seen on the clock
+        expected = self._last_index + \
+            (arrival_time - self._last_time) / self.slope
+        wraps = int(round((expected - indexes[-1]) / self.period))
+        if wraps > 0:
+            indexes += wraps * self.period
+        return indexes
+
+    def update(self, counters, arrival_time):
+        """Register counters of a transfer which arrived at arrival_time.
+
+        Returns the de-jittered timestamps of these samples.
+        """
+        counters = np.asarray(counters, dtype=np.intp)
+        if not counters.size:
+            return np.empty((0,))
+
+        indexes = self._unwrap(counters, arrival_time)
+        self._last_counter = counters[-1]
+        self._last_index = indexes[-1]
+        self._last_time = arrival_time
+
+        if self._t0 is None:
+            self._t0 = arrival_time - indexes[-1] / self.nominal_rate
+
+        # Exponentially weighted update of the fit
+        x = float(indexes[-1])
+        y = arrival_time - self._t0
+        self._weight = self._decay * self._weight + 1.0
+        dx = x - self._mean_x
+        self._mean_x += dx / self._weight
+        self._mean_y += (y - self._mean_y) / self._weight
+        self._cov_xx = self._decay * self._cov_xx + dx * (x - self._mean_x)
+        self._cov_xy = self._decay * self._cov_xy + dx * (y - self._mean_y)
+
+        slope = self.slope
+        intercept = self._t0 + self._mean_y - slope * self._mean_x
+        return intercept + slope * indexes
@@ -23,35 +23,221 @@ import numpy as np
 import os
 import time
 
+try:
+    string_types = basestring
+except NameError:
+    # Python 3
+    string_types = str
+
+# Bits of the flags field of samples
+FLAG_LOST_BEFORE = 0x01     # Packets were lost right before this sample
+FLAG_FILLED = 0x02          # Sample is inserted in place of a lost packet
+
+def get_sample_dtype(n_channels=14):
+    """Returns the packed record dtype of acquired samples.
+
+    Levels are kept raw as read from the headset, use get_microvolts()
+    to scale them.
+    """
+    return np.dtype([("counter", np.uint8),
+                     ("levels", np.int16, (n_channels,)),
+                     ("gyroX", np.int16),
+                     ("gyroY", np.int16),
+                     ("flags", np.uint8)])
+
+def get_microvolts(samples, vres=0.51):
+    """Returns the levels of samples in uV as an (N x channels) array."""
+    return vres * samples["levels"]
+
+def set_levels(counters, levels, level_table):
+    """Returns an (N x 32) array of packets with the given contents.
+
+    This is the inverse of get_levels(): counters has N elements and
+    levels is an (N x channels) array of raw levels laid out according
+    to level_table. If channels share bits, later ones overwrite them.
+    """
+    offsets, shifts = level_table
+    levels = np.asarray(levels, dtype=np.uint16)
+    n_packets = levels.shape[0]
+
+    # Spread the levels over the 248 bits following the counter
+    bits = np.zeros((n_packets, 31 * 8), dtype=np.uint8)
+    positions = 8 * (offsets - 1) + shifts
+    for ch in range(positions.shape[0]):
+        bits[:, positions[ch]] = (levels[:, ch, None] >> np.arange(14)) & 1
+
+    frames = np.empty((n_packets, 32), dtype=np.uint8)
+    frames[:, 0] = counters
+    frames[:, 1:] = np.dot(bits.reshape((n_packets, 31, 8)),
+                           1 << np.arange(8))
+    return frames
+
+def get_counter_period(seq_numbers):
+    """Returns the counter period of a sequence.
+
+    Counters of EEG packets wrap at 128. If battery packets are kept
+    in the sequence, they come with counters >= 128 after counter 127
+    so the period is 129.
+    """
+    return 129 if np.any(np.asarray(seq_numbers) >= 128) else 128
+
+def _unwrap_counters(seq_numbers, period):
+    """Returns counters as intp with battery counters mapped to 128."""
+    ctr = np.asarray(seq_numbers).astype(np.intp)
+    if period == 129:
+        ctr = np.minimum(ctr, 128)
+    return ctr
+
+def analyze_packet_loss(seq_numbers, block_size=None, period=None):
+    """Analyze packet losses in a sequence of packet counters.
+
+    Returns a dict with the "positions" of the gaps, i.e. indexes in
+    seq_numbers after which packets are missing, their "lengths", the
+    total number of "lost" packets and the loss "ratio". If block_size
+    is given, "blocks" has the number of packets lost within each block
+    of block_size received packets. period is detected with
+    get_counter_period() if not given.
+
+    Losses of period or more consecutive packets can't be detected.
+    """
+    if period is None:
+        period = get_counter_period(seq_numbers)
+    ctr = _unwrap_counters(seq_numbers, period)
+
+    lengths = (np.diff(ctr) - 1) % period
+    positions = np.flatnonzero(lengths)
+    lengths = lengths[positions]
+
+    lost = int(lengths.sum())
+    result = {
+        "positions": positions,
+        "lengths": lengths,
+        "lost": lost,
+        "ratio": float(lost) / (lost + ctr.size) if ctr.size else 0.0,
+        "blocks": None,
+    }
+
+    if block_size:
+        n_blocks = (ctr.size + block_size - 1) // block_size
+        result["blocks"] = np.bincount(positions // block_size,
+                                       weights=lengths,
+                                       minlength=n_blocks).astype(np.intp)
+    return result
+
+def fill_packet_gaps(seq_numbers, data, mode="nan", period=None):
+    """Insert rows for lost packets to keep the sample timeline aligned.
+
+    data has one row per counter in seq_numbers. Inserted rows are NaN
+    if mode is "nan" or linearly interpolated between the neighbouring
+    rows if mode is "interpolate". Returns the filled counters, the
+    filled data as float64 and a boolean mask of the inserted rows.
+    """
+    if mode not in ("nan", "interpolate"):
+        raise ValueError("mode should be 'nan' or 'interpolate'")
+    if period is None:
+        period = get_counter_period(seq_numbers)
+    ctr = _unwrap_counters(seq_numbers, period)
+    data = np.asarray(data)
+
+    loss = analyze_packet_loss(ctr, period=period)
+
+    # Shift every received row by the number of packets lost before it
+    shift = np.zeros(ctr.size, dtype=np.intp)
+    shift[loss["positions"] + 1] = loss["lengths"]
+    rows = np.arange(ctr.size) + np.cumsum(shift)
+    n_rows = ctr.size + loss["lost"]
+
+    inserted = np.ones(n_rows, dtype=bool)
+    inserted[rows] = False
+
+    filled = np.empty((n_rows,) + data.shape[1:], dtype=np.float64)
+    if mode == "nan":
+        filled.fill(np.nan)
+        filled[rows] = data
+    else:
+        all_rows = np.arange(n_rows)
+        flat = data.reshape((ctr.size, -1))
+        filled_flat = filled.reshape((n_rows, -1))
+        for i in range(flat.shape[1]):
+            filled_flat[:, i] = np.interp(all_rows, rows, flat[:, i])
+
+    counters = np.zeros(n_rows, dtype=np.intp)
+    if n_rows:
+        counters = (ctr[0] + np.arange(n_rows)) % period
+    return counters, filled, inserted
+
 def check_packet_drops(seq_numbers):
-    lost = []
-    for seq in xrange(len(seq_numbers) - 1):
-        cur = int(seq_numbers[seq])
-        _next = int(seq_numbers[seq + 1])
-        if ((cur + 1) % 128) != _next:
-            lost.append((cur + 1) % 128)
-    return lost
+    """Returns the first lost counter of every gap in seq_numbers."""
+    period = get_counter_period(seq_numbers)
+    ctr = _unwrap_counters(seq_numbers, period)
+    positions = analyze_packet_loss(ctr, period=period)["positions"]
+    return ((ctr[positions] + 1) % period).tolist()
 
 def get_level(raw_data, bits):
     """Returns signal level from raw_data frame."""
+    # Indexing a bytearray gives integers on Python 2 and 3
+    raw_data = bytearray(raw_data)
     level = 0
     for i in range(13, -1, -1):
         level <<= 1
-        b, o = (bits[i] / 8) + 1, bits[i] % 8
-        level |= (ord(raw_data[b]) >> o) & 1
+        b, o = (bits[i] // 8) + 1, bits[i] % 8
+        level |= (raw_data[b] >> o) & 1
     return 0.51*level
 
+# Weights of the 14 bits forming a level, LSB first
+LEVEL_WEIGHTS = 1 << np.arange(14, dtype=np.uint16)
+
+def get_frames(packets):
+    """Returns an (N x 32) uint8 view of N consecutive 32-byte packets.
+
+    packets can be a string, a bytearray, a memoryview or an ndarray.
+    Trailing bytes of an incomplete packet are ignored.
+    """
+    if isinstance(packets, np.ndarray):
+        frames = packets.ravel()
+    else:
+        frames = np.frombuffer(packets, dtype=np.uint8)
+    return frames[:frames.size - (frames.size % 32)].reshape((-1, 32))
+
+def get_level_table(bit_indexes):
+    """Returns the gather table for get_levels().
+
+    bit_indexes is a list of emokit-style bit index lists, one per
+    channel. The table consists of the byte offsets and the bit shifts
+    of every bit, both shaped (channels x 14).
+    """
+    bits = np.array(bit_indexes, dtype=np.intp)
+    return (bits // 8) + 1, (bits % 8).astype(np.uint8)
+
+def get_levels(frames, level_table):
+    """Returns raw signal levels of all frames as an (N x channels) array.
+
+    This is the vectorized version of get_level(): frames is what
+    get_frames() returns and level_table is what get_level_table()
+    returns. The levels are not scaled to microvolts.
+    """
+    offsets, shifts = level_table
+    bits = (frames[:, offsets] >> shifts) & 1
+    return np.dot(bits, LEVEL_WEIGHTS)
+
 def save_as_matlab(_buffer, channel_mask, folder=None, prefix=None, filename=None, metadata=None):
-    """Save as matlab data with optional metadata."""
-    nr_samples = _buffer[:, 0].size
-    trial = np.zeros((1,), dtype=np.object)
-    trial[0] = _buffer[:, 1:].astype(np.float64).T
-    trial_time = np.zeros((1,), dtype=np.object)
-    trial_time[0] = np.array(range(nr_samples)) / 128.0
+    """Save as matlab data with optional metadata.
+
+    _buffer is either an array of samples with get_sample_dtype() or
+    a 2D array of levels in uV with the counters in the first column.
+    """
+    nr_samples = _buffer.shape[0]
+    trial = np.zeros((1,), dtype=object)
+    if _buffer.dtype.names:
+        trial[0] = get_microvolts(_buffer).T
+    else:
+        trial[0] = _buffer[:, 1:].astype(np.float64).T
+    trial_time = np.zeros((1,), dtype=object)
+    trial_time[0] = np.arange(nr_samples) / 128.0
 
     # This structure can be read by fieldtrip functions directly
     fieldtrip_data = {"fsample"     : 128.0,
-                      "label"       : np.array(channel_mask, dtype=np.object).reshape((len(channel_mask), 1)),
+                      "label"       : np.array(channel_mask, dtype=object).reshape((len(channel_mask), 1)),
                       "trial"       : trial,
                       "time"        : trial_time,
                       "sampleinfo"  : np.array([1, nr_samples])}
@@ -68,8 +254,11 @@ def save_as_matlab(_buffer, channel_mask, folder=None, prefix=None, filename=Non
     date_info = time.strftime("%d-%m-%Y_%H-%M-%S")
     matlab_data["date"] = date_info
 
+    # Unit of the trials, replay needs it to encode them back
+    matlab_data["unit"] = "uV"
+
     if not filename:
-        if metadata and metadata.has_key("Initials"):
+        if metadata and "Initials" in metadata:
             filename = "emotiv-%s-%s.mat" % (metadata["Initials"], date_info)
         else:
             filename = "emotiv-%s.mat" % date_info
@@ -0,0 +1,215 @@
+# -*- coding: utf-8 -*-
+# vim:set et ts=4 sw=4:
+#
+## Copyright (C) 2013 Ozan Çağlayan <ocaglayan@gsu.edu.tr>
+##
+## This program is free software; you can redistribute it and/or modify
+## it under the terms of the GNU General Public License as published by
+## the Free Software Foundation; either version 2 of the License, or
+## (at your option) any later version.
+
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+## GNU General Public License for more details.
+
+## You should have received a copy of the GNU General Public License
+## along with this program; if not, write to the Free Software
+## Foundation, Inc., 675 Mass Ave, Cambridge, MA 02139, USA.
+
+"""\
+This module provides a framed binary protocol to send arrays of
+samples over stream sockets.
+
+Every frame starts with a HEADER_SIZE bytes header holding the magic,
+the protocol version, the frame kind, the size of the array
+description, the sequence number, the payload size and two
+timestamps: the acquisition time of the data and the time the frame
+was sent. The array description is the shape and the dtype of the
+payload. Arrays are sent from and received into their own memory,
+there's no string conversion on either side.
+"""
+
+import json
+import struct
+
+import numpy as np
+
+from .timing import local_clock
+from .utils import string_types
+
+MAGIC = b"EPWF"
+VERSION = 1
+
+# magic, version, kind, description size, sequence number, payload
+# size, acquisition time, send time
+HEADER_FORMAT = "<4sBBHIIdd"
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+
+# Frame kinds
+METADATA = 1
+DATA = 2
+END = 3
+
+
+class WireError(Exception):
+    """Raised on malformed frames and closed connections."""
+    pass
+
+
+def _describe(array):
+    """Return the description of the shape and the dtype of array."""
+    return json.dumps([array.shape,
+                       np.lib.format.dtype_to_descr(array.dtype)]).encode()
+
+
+def _parse_description(description):
+    shape, descr = json.loads(description.decode("ascii"))
+    if isinstance(descr, list):
+        # Field names and formats come back as lists and unicode
+        descr = [tuple(str(x) if isinstance(x, string_types) else x
+                       for x in field) for field in descr]
+    return tuple(shape), np.dtype(descr)
+
+
+def recv_exactly(sock, buf):
+    """Fill a bytearray or a contiguous array from sock, however many
+    reads it takes. Raises WireError if the connection is closed first."""
+    if isinstance(buf, np.ndarray):
+        buf = buf.reshape(-1).view(np.uint8)
+    view = memoryview(buf)
+    size = len(view)
+    pos = 0
+    while pos < size:
+        n = sock.recv_into(view[pos:], size - pos)
+        if n == 0:
+            raise WireError("Connection closed after %d of %d bytes." %
+                            (pos, size))
+        pos += n
+
+
+class FrameWriter(object):
+    """Send metadata and arrays as frames over a connected socket."""
+
+    def __init__(self, sock):
+        self.sock = sock
+        self.seq = 0
+
+    def _send(self, kind, description, payload, timestamp):
+        header = struct.pack(HEADER_FORMAT, MAGIC, VERSION, kind,
+                             len(description), self.seq, len(payload),
+                             timestamp or 0.0, local_clock())
+        self.sock.sendall(header + description)
+        if len(payload):
+            self.sock.sendall(payload)
+        self.seq += 1
+
+    def send_metadata(self, metadata):
+        """Send a dict which can be serialized as JSON."""
+        self._send(METADATA, b"", json.dumps(metadata).encode("utf-8"),
+                   None)
+
+    def send_array(self, array, timestamp=None):
+        """Send an array acquired at timestamp, local_clock() time."""
+        array = np.ascontiguousarray(array)
+        # Bytes view of the array, sent without a copy
+        self._send(DATA, _describe(array), array.reshape(-1).view(np.uint8),
+                   timestamp)
+
+    def close(self):
+        """Tell the receiver that no more frames will come."""
+        self._send(END, b"", b"", None)
+
+
+class FrameReader(object):
+    """Receive frames sent by a FrameWriter.
+
+    Headers and payloads are read with recv_into into preallocated
+    buffers, partial reads are completed before a frame is returned.
+    """
+
+    def __init__(self, sock):
+        self.sock = sock
+        self.header = None
+        self._header = bytearray(HEADER_SIZE)
+        self._description = None
+        self._layout = None
+        self._buffer = None
+        self._expected_seq = 0
+        self.skipped = 0
+
+    def _recv_header(self):
+        recv_exactly(self.sock, self._header)
+        magic, version, kind, desc_size, seq, size, timestamp, sent = \
+            struct.unpack(HEADER_FORMAT, bytes(self._header))
+        if magic != MAGIC:
+            raise WireError("Bad frame magic %r." % magic)
+        if version != VERSION:
+            raise WireError("Unsupported protocol version %d." % version)
+
+        description = b""
+        if desc_size:
+            buf = bytearray(desc_size)
+            recv_exactly(self.sock, buf)
+            description = bytes(buf)
+
+        self.skipped += (seq - self._expected_seq) & 0xffffffff
+        self._expected_seq = (seq + 1) & 0xffffffff
+        self.header = {
+            "kind": kind,
+            "seq": seq,
+            "size": size,
+            "timestamp": timestamp,
+            "sent": sent,
+            "description": description,
+        }
+        return self.header
+
+    def recv(self, out=None):
+        """Receive the next frame.
+
+        Returns ("metadata", dict), ("data", array) or ("end", None).
+        Arrays are received into out if given, which must have the
+        dtype of the frame and room for its rows, and the filled part
+        of out is returned. Otherwise they're received into a buffer
+        reused as long as the shape and dtype don't change, so copy
+        them if they're kept across calls.
+        """
+        header = self._recv_header()
+
+        if header["kind"] == METADATA:
+            buf = bytearray(header["size"])
+            recv_exactly(self.sock, buf)
+            return "metadata", json.loads(bytes(buf).decode("utf-8"))
+
+        if header["kind"] == END:
+            return "end", None
+
+        if header["kind"] != DATA:
+            raise WireError("Unknown frame kind %d." % header["kind"])
+
+        if header["description"] != self._description:
+            self._layout = _parse_description(header["description"])
+            self._description = header["description"]
+            self._buffer = None
+        shape, dtype = self._layout
+
+        if int(np.prod(shape)) * dtype.itemsize != header["size"]:
+            raise WireError("Payload size doesn't match %s %s." %
+                            (shape, dtype))
+
+        if out is not None:
+            if out.dtype != dtype or out.shape[1:] != shape[1:] or \
+                    out.shape[0] < shape[0] or \
+                    not out.flags.c_contiguous:
+                raise WireError("Can't receive %s %s into %s %s." %
+                                (shape, dtype, out.shape, out.dtype))
+            array = out[:shape[0]]
+        else:
+            if self._buffer is None:
+                self._buffer = np.empty(shape, dtype=dtype)
+            array = self._buffer
+
+        if header["size"]:
+            recv_exactly(self.sock, array)
+        return "data", array
@@ -30,16 +30,16 @@ SSVEPD_PID = "/var/run/bbb-bci-ssvepd.pid"
 DSPD_SOCK = "/tmp/bbb-bci-dspd.sock"
 
 try:
-    from emotiv import epoc, utils
+    from emotiv import epoc, utils, wire
 except ImportError:
     sys.path.insert(0, "..")
-    from emotiv import epoc, utils
+    from emotiv import epoc, utils, wire
 
 def get_subject_information():
     initials = raw_input("Initials: ")
     age = raw_input("Age: ")
     sex = raw_input("Sex (M)ale / (F)emale: ")
-    return ",".join([initials[:2], age[:2], sex[0]])
+    return {"Initials": initials, "Age": age, "Sex": sex[:1]}
 
 def main():
 
@@ -67,25 +67,23 @@ def main():
     except:
         pass
 
-    # Experiment data (7 bytes)
-    experiment = get_subject_information()
-    sock.send("%7s" % experiment)
-
-    # Send 4 bytes of data for duration
-    sock.send("%4d" % duration)
-
-    # Send comma separated list of enabled channels (49 bytes max.)
-    channel_conf = "CTR," + ",".join(headset.channel_mask)
-    sock.send("%49s" % channel_conf)
+    # Send the experiment and the channel configuration
+    writer = wire.FrameWriter(sock)
+    writer.send_metadata({
+        "subject": get_subject_information(),
+        "duration": duration,
+        "channel_mask": headset.channel_mask,
+        })
 
     os.kill(ssvepd_pid, signal.SIGUSR1)
     for i in range(duration):
         # Fetch 1 second of data each time
         data = headset.acquire_data(1)
 
-        # Send the data to DSP block
-        sock.sendall(data.tostring())
+        # Send the data to DSP block with its arrival time
+        writer.send_array(data, headset.read_time)
 
+    writer.close()
     os.kill(ssvepd_pid, signal.SIGUSR1)
 
     # Close devices
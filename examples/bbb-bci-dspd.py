@@ -22,31 +22,23 @@ import os
 import sys
 import socket
 
-from emotiv import utils
+from emotiv import utils, wire, analysis
 
 import numpy as np
-from scipy import signal, fftpack
 
 SOCKET = "/tmp/bbb-bci-dspd.sock"
-RECVSIZE = 4096 * 8
-
-def process_eeg(data):
-    print "Lost packets: ", utils.check_packet_drops(data[:, CTR])
-
-    ch = signal.detrend(data[:, O2].T)
-    time_step = 1/128.0
-    sample_freq = fftpack.fftfreq(ch.size, d=time_step)
-    pidxs = np.where(sample_freq > 0)
-    freqs = sample_freq[pidxs]
-
-    fft = fftpack.fft(ch)
-    power = np.abs(fft)[pidxs]
-    max_power_ind = power.argmax()
-    max_args = power.argsort()[::-1][:5]
-    print freqs[max_args], power[max_args]
-    #print "Power\n-----------------------------\n"
-    #print power
-    #print "\n".join("%10s: \t%2.f" % (z[0],z[1]) for z in zip(freqs, power))
+
+# Stimulus frequencies tracked if the acquisition doesn't send them
+STIMULUS_FREQS = [12, 15, 17, 20]
+
+def process_eeg(data, detector):
+    print "Lost packets: ", utils.check_packet_drops(data["counter"])
+
+    # Power at the stimulus frequencies and their harmonics over the
+    # last second, only these bins are computed
+    power = detector.update(utils.get_microvolts(data))[:, O2]
+    order = power.argsort()[::-1]
+    print detector.freqs[order], power[order]
 
 def main():
     try:
@@ -61,50 +53,55 @@ def main():
     # Blocks to wait a new connection
     client, client_addr = server.accept()
 
-    # Get experiment metadata (7 bytes)
-    experiment = client.recv(7)
-    metadata = dict((k,v) for k,v in zip(["Initials", "Age", "Sex"], experiment.split(",")))
-
-    # Get experiment max duration (4 digits)
-    duration = int(client.recv(4))
-
-    # Get comma separated channel configuration (49 bytes max)
-    # Expose them as global variables to use them as int indices
-    channel_conf = client.recv(49)
-    for i, ch in enumerate(channel_conf.strip().split(",")):
+    # Get experiment metadata, duration and channel configuration
+    reader = wire.FrameReader(client)
+    kind, experiment = reader.recv()
+    if kind != "metadata":
+        print "Expected the experiment metadata first."
+        return 1
+    metadata = dict((str(k), str(v)) for k, v in experiment["subject"].items())
+    duration = int(experiment["duration"])
+
+    # Expose channels as global variables to use them as int indices
+    channel_mask = [str(ch) for ch in experiment["channel_mask"]]
+    for i, ch in enumerate(channel_mask):
         globals()[ch] = i
-    n_channels = i + 1
 
-    globals()["channel_mask"] = channel_conf.strip().split(",")[1:]
+    # Goertzel detector over a sliding window of 1 second
+    detector = analysis.GoertzelBank(experiment.get("freqs", STIMULUS_FREQS),
+                                     harmonics=2,
+                                     n_channels=len(channel_mask),
+                                     window=128)
 
     # Preliminary buffer to accumulate data
-    data = np.empty((duration * 128, n_channels), dtype=np.uint16)
+    sample_dtype = utils.get_sample_dtype(len(channel_mask))
+    data = np.zeros(duration * 128, dtype=sample_dtype)
+    n_samples = 0
 
     try:
-        for i in range(duration):
-            # Blocks
-            raw_bytes = client.recv(RECVSIZE)
-
-            # We should receive 1 second of EEG data 128x15 matrix
-            d = np.fromstring(raw_bytes, dtype=np.uint16).reshape((128, n_channels))
-
-            # This is for accumulating
-            data[i * 128:(i+1) * 128, :] = d
+        while True:
+            # Blocks until 1 second of EEG data is received, directly
+            # into the accumulation buffer
+            kind, d = reader.recv(out=data[n_samples:])
+            if kind == "end":
+                break
+            n_samples += d.size
 
             # Process data
-            #process_eeg(data[:(i+1)*128, :])
-            process_eeg(d)
+            process_eeg(d, detector)
 
     except Exception, e:
         print e
         pass
     finally:
+        data = data[:n_samples]
         # Pass the result back to acquisition daemon
         # TODO: client.send(...)
         server.close()
         os.unlink(SOCKET)
         utils.save_as_matlab(data, channel_mask, metadata=metadata)
-        print "Total packet lost: %d/%d" % (len(utils.check_packet_drops(data[:, CTR])), data[:, CTR].size)
+        loss = utils.analyze_packet_loss(data["counter"])
+        print "Total packet lost: %d/%d" % (loss["lost"], loss["lost"] + data.size)
 
 if __name__ == "__main__":
     sys.exit(main())
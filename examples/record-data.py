@@ -48,7 +48,7 @@ def main():
         headset.set_channel_mask(channels)
 
     # Acquire
-    idx, data = headset.acquire_data_fast(duration)
+    data = headset.acquire_data_fast(duration)
 
     print "Battery: %d %%" % headset.battery
     print "Contact qualities"
@@ -29,11 +29,7 @@ from multiprocessing import Process, Pipe
 
 from espeak import espeak
 
-import numpy as np
-from scipy.signal import filtfilt, butter, detrend
-from nitime.algorithms.spectral import multi_taper_psd
-
-from emotiv import epoc, utils
+from emotiv import epoc, utils, analysis
 
 # DATA_DIR to save Matlab datasets
 DATA_DIR = os.path.expanduser("~/BCIData")
@@ -42,20 +38,15 @@ DATA_DIR = os.path.expanduser("~/BCIData")
 CUE_BASED = False
 
 ### Classifier delegate
-def classifier(conn):
-    # Setup filter coefficients
-    Wn = 5 / 64.0
-    b, a = butter(2, Wn, "highpass")
+def classifier(conn, stream):
+    # Causal high-pass filter keeping its state across blocks
+    highpass = analysis.StreamFilter.highpass(5.0, order=2)
 
     # Get experiment details
     experiment = conn.recv()
 
     # Setup PSD parameters
     psd_step = 1.0 / experiment['block_size']
-    psd_points = (64 / psd_step) + 1
-    freqs = np.linspace(0, 64, psd_points)
-    psd = np.zeros((psd_points,))
-    avg_psd = np.empty((psd_points,))
 
     # Fetch flickering frequencies
     freq_left = int(experiment['freq_left'])
@@ -64,49 +55,54 @@ def classifier(conn):
     # List for scores
     LEFT, RIGHT = range(2)
 
-    if psd_step == 1:
-        # Scoring is at the fundamental frequencies
-        left_score = [freq_left]
-        right_score = [freq_right]
-    else:
-        # Scoring is the average of the 3 neighbours centered
-        # at the fundamental frequency, e.g. 16.5, 17, 17.5 for 17Hz for psd_step = 0.5
-        left_score  = range(int((freq_left  / psd_step)) - 1, int((freq_left  / psd_step)) + 2)
-        right_score = range(int((freq_right / psd_step)) - 1, int((freq_right / psd_step)) + 2)
+    # Scoring is at the fundamental frequencies, or the average of the
+    # 3 neighbours centered at them, e.g. 16.5, 17, 17.5 for 17Hz for
+    # psd_step = 0.5
+    scorer = analysis.SSVEPScorer.harmonics(
+        [freq_left, freq_right], 1, psd_step,
+        neighbours=0 if psd_step == 1 else 1)
+
+    print "Frequency points\nleft: %s\nright: %s" % tuple(scorer.score_freqs)
 
-    print "Frequency points\nleft: %s:%s\nright: %s:%s" % (left_score, freqs[left_score], right_score, freqs[right_score])
+    # PSD of the last block_size seconds, updated every hop_size samples
+    block_samples = experiment['block_size'] * 128
+    hop_samples = experiment.get('hop_size', block_samples)
+    sliding_psd = analysis.SlidingPSD(1, block_samples, hop_samples)
 
     while 1:
         its = 0
         scores = [0, 0]
 
-        # Clear the array
-        psd.fill(0)
-
-        while 1:
-            # Wait for data
-            data = conn.recv()
+        # Clear the averages and the filter state
+        sliding_psd.reset()
+        highpass.reset()
 
-            # Filter it
-            f_data = filtfilt(b, a, detrend(data[:,0]))
+        # Sequence number of the first sample of this run
+        seq = conn.recv()
 
-            # Computer PSD and average it with the previous blocks
-            psd += multi_taper_psd(f_data, Fs=128.0)[1]
-            avg_psd = psd / (its + 1)
+        winner = None
+        while not winner:
+            # Wait for the next hop of data in the shared stream
+            stream.wait(seq + hop_samples)
+            eeg, seq = stream.read_since(seq, hop_samples)
+            data = utils.get_microvolts(eeg)
 
-            # Increment counter
-            its += 1
+            # Filter it, continuing from the previous hop, and average
+            # the PSDs of the windows it completes with the previous ones
+            f_data = highpass.process(data[:,0])
+            for i in range(len(sliding_psd.update(f_data))):
+                # Increment counter
+                its += 1
 
-            left = avg_psd[left_score].mean()
-            right = avg_psd[right_score].mean()
+                left, right = scorer.score(sliding_psd.psd[:, 0])
 
-            scores[LEFT if left > right else RIGHT] += 1
+                scores[LEFT if left > right else RIGHT] += 1
 
-            # If one class won at least 3 times, we decide for it.
-            if abs(scores[LEFT] - scores[RIGHT]) >= 3:
-                winner = "Left" if scores[LEFT] > scores[RIGHT] else "Right"
-                conn.send({"iterations": its, "winner": winner})
-                break
+                # If one class won at least 3 times, we decide for it.
+                if abs(scores[LEFT] - scores[RIGHT]) >= 3:
+                    winner = "Left" if scores[LEFT] > scores[RIGHT] else "Right"
+                    conn.send({"iterations": its, "winner": winner})
+                    break
 
 
 def stop_callback(pid):
@@ -117,11 +113,6 @@ def main(argv):
     sound_enabled = "no soundcards" not in open("/proc/asound/cards", "r").read().strip()
     # Is there any robot plugged?
 
-    # Create a Pipe IPC
-    p_conn, c_conn = Pipe()
-    dspd = Process(target=classifier, args=(c_conn,))
-    dspd.start()
-
     # Set niceness of this process
     os.nice(-3)
 
@@ -154,6 +145,16 @@ def main(argv):
     headset = epoc.EPOC(enable_gyro=False)
     headset.set_channel_mask(["O1", "O2", "P7", "P8"])
 
+    # Acquire continuously in the background into shared memory which
+    # the classifier reads without copies. The Pipe only carries the
+    # experiment, the start of each run and the results. The classifier
+    # is forked before the reader thread is started.
+    headset.create_stream(shared=True)
+    p_conn, c_conn = Pipe()
+    dspd = Process(target=classifier, args=(c_conn, headset.stream))
+    dspd.start()
+    headset.start_stream()
+
     # Collect experiment information
     experiment = {}
     experiment['n_runs'] = n_runs
@@ -161,6 +162,8 @@ def main(argv):
     experiment['freq_right'] = freq_right
     experiment['channel_mask'] = headset.channel_mask
     experiment['block_size'] = 2
+    # Slide the PSD window every 250 ms
+    experiment['hop_size'] = 32
 
     if sound_enabled:
         # Set TTS parameters
@@ -174,7 +177,7 @@ def main(argv):
         random.shuffle(cues)
         experiment['cues'] = cues
 
-    # Let classifier compute a PSD average over 2 second blocks
+    # Let classifier compute a PSD average over 2 second windows
     p_conn.send(experiment)
 
     # Repeat n_runs time
@@ -188,23 +191,15 @@ def main(argv):
 
             time.sleep(2)
 
-        # Start flickering
+        # Start flickering and let the classifier read from now on
         ssvepd.send_signal(signal.SIGUSR1)
+        p_conn.send(headset.stream.seq)
 
-        # Acquire EEG data until classified
-        while 1:
-            idx, eeg = headset.acquire_data_fast(experiment['block_size'])
-            if not p_conn.poll():
-                # Not classified yet
-                p_conn.send(eeg)
-            else:
-                break
+        # Block until classified, the stream keeps acquiring meanwhile
+        result = p_conn.recv()
 
         # Stop flickering
         ssvepd.send_signal(signal.SIGUSR1)
-
-        # There's something to receive from classifier
-        result = p_conn.recv()
         if sound_enabled:
             espeak.synth(result["winner"])
             while espeak.is_playing():
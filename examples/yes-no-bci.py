@@ -28,13 +28,10 @@ import subprocess
 
 from espeak import espeak
 
-import numpy as np
-from scipy.io import savemat
-
 DSPD_SOCK = "/tmp/bbb-bci-dspd.sock"
 DATA_DIR = os.path.expanduser("~/BCIData")
 
-from emotiv import epoc, utils
+from emotiv import epoc, utils, storage
 
 
 def get_subject_information():
@@ -49,42 +46,14 @@ def get_subject_information():
             "comment"   :  comment,
            }
 
-def save_as_dataset(rest_eegs, ssvep_eegs, experiment):
-    """Save whole recording as a single dataset."""
-    matlab_data = {}
-
-    # len(rest_eegs) == len(ssvep_eegs) == experiment['n_trials']
+def open_dataset(experiment):
+    """Open the dataset to which trials are written as they're acquired."""
     n_trials = experiment['n_trials']
     channel_mask = experiment['channel_mask']
 
-    trial = np.zeros((n_trials,), dtype=np.object)
-    rest = np.zeros((n_trials,), dtype=np.object)
-    trial_time = np.zeros((n_trials,), dtype=np.object)
-
-    for t in range(n_trials):
-        trial[t] = ssvep_eegs[t][:, :].T
-        trial_time[t] = np.array(range(ssvep_eegs[t][:, 0].size)) / 128.0
-        if rest_eegs:
-            rest[t] = rest_eegs[t][:, :].T
-
-    # This structure can be read by fieldtrip functions directly
-    fieldtrip_data = {"fsample"     : 128.0,
-                      "label"       : np.array(channel_mask, dtype=np.object).reshape((len(channel_mask), 1)),
-                      "trial"       : trial,
-                      "rest"        : rest,
-                      "time"        : trial_time,
-                     }
-
-    matlab_data["data"] = fieldtrip_data
-
-    # Inject metadata if any
-    for key, value in experiment.items():
-        matlab_data[key] = value
-
     # Put time of recording
     date_info = time.strftime("%d-%m-%Y_%H-%M")
     day_info = time.strftime("%d-%m-%Y")
-    matlab_data["date"] = date_info
 
     output = "%s-%d-trials-of-%dsecs-%s-%sHz-%sHz-%s" % (experiment['initials'],
                                                          n_trials, experiment['trial_duration'],
@@ -97,7 +66,12 @@ def save_as_dataset(rest_eegs, ssvep_eegs, experiment):
         os.makedirs(output_folder)
     except:
         pass
-    savemat(os.path.join(output_folder, "dataset.mat"), matlab_data, oned_as='row')
+
+    # This structure can be read by fieldtrip functions directly
+    dataset = storage.SessionWriter(os.path.join(output_folder, "dataset.mat"),
+                                    channel_mask, metadata=experiment)
+    dataset.set_metadata("date", date_info)
+    return dataset
 
 def stop_callback(pid):
     os.kill(pid, signal.SIGUSR1)
@@ -183,15 +157,16 @@ def main(argv):
     # channel_conf = "CTR," + ",".join(headset.channel_mask)
     # sock.send("%49s" % channel_conf)
 
-    rest_eegs = []
-    ssvep_eegs = []
+    # Trials are saved as soon as they're acquired
+    dataset = open_dataset(experiment)
 
     # Repeat nb_trials time
     for i in range(experiment['n_trials']):
         # Acquire resting data (A random duration of 2,3 or 4 seconds to avoid adaptation)
-        #idx, eeg = headset.acquire_data_fast(random.randint(2,4))
-        #rest_eegs.append(eeg)
-        #print utils.check_packet_drops(idx)
+        rest_eeg = None
+        #rest_eeg = headset.acquire_data_fast(random.randint(2,4))
+        #print utils.check_packet_drops(rest_eeg["counter"])
+        dataset.append_cell("rest", rest_eeg)
 
         # Give an auditory cue
         espeak.synth(cues[i])
@@ -205,13 +180,15 @@ def main(argv):
         ssvepd.send_signal(signal.SIGUSR1)
 
         # Acquire EEG data for duration seconds and stop flickering
-        idx, eeg = headset.acquire_data_fast(duration, stop_callback, ssvepd.pid)
-        ssvep_eegs.append(eeg)
-        #print utils.check_packet_drops(idx)
-
-    # Save dataset
-    experiment['battery'] = headset.battery
-    save_as_dataset(rest_eegs, ssvep_eegs, experiment)
+        eeg = headset.acquire_data_fast(duration, stop_callback, ssvepd.pid)
+        dataset.start_trial()
+        dataset.append(eeg)
+        dataset.end_trial()
+        #print utils.check_packet_drops(eeg["counter"])
+
+    # Close dataset
+    dataset.set_metadata("battery", headset.battery)
+    dataset.close()
 
     # Cleanup
     try:
@@ -0,0 +1,165 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:set et ts=4 sw=4:
+#
+## Copyright (C) 2013 Ozan Çağlayan <ocaglayan@gsu.edu.tr>
+##
+## This program is free software; you can redistribute it and/or modify
+## it under the terms of the GNU General Public License as published by
+## the Free Software Foundation; either version 2 of the License, or
+## (at your option) any later version.
+
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+## GNU General Public License for more details.
+
+## You should have received a copy of the GNU General Public License
+## along with this program; if not, write to the Free Software
+## Foundation, Inc., 675 Mass Ave, Cambridge, MA 02139, USA.
+
+"""\
+Microbenchmarks for the decode, decrypt and acquisition hot paths.
+
+Synthetic packets are encrypted with the key of a research and of a
+consumer headset and played back through method="replay", so no
+headset is needed. Results are printed in packets per second, pass
+an output file to also save them as JSON along with the git revision.
+"""
+
+import os
+import sys
+import json
+import time
+import tempfile
+import subprocess
+
+import numpy as np
+
+try:
+    from emotiv import epoc, utils, capture
+except ImportError:
+    sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+    from emotiv import epoc, utils, capture
+
+SERIAL_NUMBER = "SN201211150000XY"
+N_PACKETS = 129 * 40
+REPEAT = 3
+
+
+def make_packets(n_packets, seed=0):
+    """Return decrypted packets with counters, battery and random levels."""
+    rng = np.random.RandomState(seed)
+    counters = np.arange(n_packets) % 129
+    counters[counters == 128] = 247
+
+    headset = epoc.EPOC
+    table = utils.get_level_table(
+        [headset.bit_indexes[ch] for ch in headset.channels])
+    levels = rng.randint(7000, 10000, size=(n_packets, len(headset.channels)))
+    return utils.set_levels(counters, levels, table)
+
+
+def make_headset(headset_type, packets):
+    """Return an EPOC replaying packets encrypted for headset_type."""
+    keygen = epoc.EPOC(method="dummy")
+    keygen.serial_number = SERIAL_NUMBER
+    keygen.headset_type = headset_type
+    keygen.setup_encryption()
+
+    fd, filename = tempfile.mkstemp(suffix=".epoc")
+    os.close(fd)
+    writer = capture.CaptureWriter(filename, keygen)
+    writer.write(keygen._cipher.encrypt(packets.tobytes()))
+    writer.close()
+
+    headset = epoc.EPOC(method="replay", replay_file=filename,
+                        replay_speed=0, replay_loop=True)
+    os.unlink(filename)
+    os.unlink(filename + ".idx")
+    return headset
+
+
+def bench(func, n_packets):
+    """Return the best packets per second of REPEAT runs of func."""
+    best = None
+    for i in range(REPEAT):
+        start = time.time()
+        func()
+        elapsed = time.time() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return n_packets / max(best, 1e-9)
+
+
+def get_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"],
+                                       stderr=subprocess.STDOUT).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def main():
+    packets = make_packets(N_PACKETS)
+    results = []
+
+    # Decoding only, on decrypted packets
+    headset = epoc.EPOC(method="dummy")
+    some = [packets[i].tobytes() for i in range(1000)]
+    bit_indexes = [headset.bit_indexes[ch] for ch in headset.channel_mask]
+
+    def get_level():
+        for raw_data in some:
+            [utils.get_level(raw_data, bits) for bits in bit_indexes]
+    results.append(("utils.get_level", bench(get_level, len(some))))
+
+    def decode():
+        headset.decode_packets(packets)
+    results.append(("decode_packets", bench(decode, N_PACKETS)))
+
+    def post_process():
+        decoded = headset.decode_packets(packets)
+        headset.update_status(decoded)
+        headset.get_samples(decoded)
+    results.append(("acquire_data_fast post-processing",
+                    bench(post_process, N_PACKETS)))
+
+    # Loss detection over a long sequence with drops
+    counters = np.arange(N_PACKETS * 25) % 128
+    counters = counters[np.random.RandomState(1).rand(counters.size) > 0.01]
+
+    def packet_drops():
+        utils.check_packet_drops(counters)
+    results.append(("check_packet_drops", bench(packet_drops, counters.size)))
+
+    # Decryption and decoding through the EPOC API
+    for headset_type in ("research", "consumer"):
+        headset = make_headset(headset_type, packets)
+
+        def get_sample():
+            for i in range(1000):
+                headset.get_sample()
+        results.append(("get_sample (%s)" % headset_type,
+                         bench(get_sample, 1000)))
+
+        def read_block():
+            for i in range(N_PACKETS // 129):
+                headset.decode_packets(headset.read_block(129))
+        results.append(("read_block + decode (%s)" % headset_type,
+                         bench(read_block, N_PACKETS)))
+
+    revision = get_revision()
+    print("Revision: %s" % revision)
+    for name, rate in results:
+        print("%-45s %14.0f packets/s" % (name, rate))
+
+    if len(sys.argv) > 1:
+        with open(sys.argv[1], "w") as f:
+            json.dump({"revision": revision, "python": sys.version.split()[0],
+                       "results": dict(results)}, f, indent=2, sort_keys=True)
+
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -20,25 +20,28 @@
 
 import sys
 
+import numpy as np
+
 try:
-    from emotiv import epoc
+    from emotiv import epoc, utils
 except ImportError:
     sys.path.insert(0, "..")
-    from emotiv import epoc
+    from emotiv import epoc, utils
 
 def main():
     # Setup headset
     headset = epoc.EPOC()
 
     try:
-        d = headset.get_sample()
-        prev_ctr = headset.counter
+        prev_ctr = np.empty((0,), dtype=np.uint8)
         while 1:
-            d = headset.get_sample()
-            ctr = headset.counter
-            if (prev_ctr + 1) % 129 != ctr:
-                print "Dropped packets between %d and %d" % (prev_ctr, ctr)
-            prev_ctr = ctr
+            # Battery packets are kept, so counters have a period of 129
+            ctr = headset.decode_packets(headset.read_block(128))["counter"]
+            ctr = np.concatenate((prev_ctr, np.minimum(ctr, 128)))
+            loss = utils.analyze_packet_loss(ctr, period=129)
+            for pos in loss["positions"]:
+                print "Dropped packets between %d and %d" % (ctr[pos], ctr[pos + 1])
+            prev_ctr = ctr[-1:]
     except:
         headset.disconnect()
         return 0
@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:set et ts=4 sw=4:
+#
+## Copyright (C) 2013 Ozan Çağlayan <ocaglayan@gsu.edu.tr>
+##
+## This program is free software; you can redistribute it and/or modify
+## it under the terms of the GNU General Public License as published by
+## the Free Software Foundation; either version 2 of the License, or
+## (at your option) any later version.
+
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+## GNU General Public License for more details.
+
+## You should have received a copy of the GNU General Public License
+## along with this program; if not, write to the Free Software
+## Foundation, Inc., 675 Mass Ave, Cambridge, MA 02139, USA.
+
+"""\
+Round trips of the metadata through the files read by storage.Recording.
+It prints OK or fails with an AssertionError.
+"""
+
+import os
+import sys
+import shutil
+import tempfile
+
+import numpy as np
+
+try:
+    from emotiv import storage, utils
+except ImportError:
+    sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+    from emotiv import storage, utils
+
+def check_matlab_cues(folder):
+    # Lists of strings are saved as character matrices, one per row
+    cues = ["Left", "Right", "Right", "Left"]
+    levels = np.zeros((128, 3))
+    utils.save_as_matlab(levels, ["O1", "O2"], folder=folder,
+                         filename="cues.mat",
+                         metadata={"cues": cues, "subject": "ab"})
+    metadata = storage.Recording(os.path.join(folder, "cues.mat")).metadata
+    assert metadata["cues"] == cues, metadata["cues"]
+    assert metadata["subject"] == "ab", metadata["subject"]
+
+def check_session_writer(folder):
+    if storage.h5py is None:
+        print("h5py is not installed, skipping the MAT 7.3 checks")
+        return
+    filename = os.path.join(folder, "session.mat")
+    cues = ["Left", "Right"]
+    writer = storage.SessionWriter(filename, ["O1", "O2"],
+                                   metadata={"cues": cues, "subject": "ab"})
+    for t in range(2):
+        writer.append_cell("rest", None if t else np.ones((64, 2)))
+        writer.start_trial()
+        writer.append(np.arange(256.0).reshape(128, 2) + t)
+        writer.end_trial()
+    writer.close()
+
+    with open(filename, "rb") as f:
+        assert f.read(10) == b"MATLAB 7.3"
+    recording = storage.Recording(filename)
+    assert recording.metadata["cues"] == cues, recording.metadata["cues"]
+    assert recording.metadata["subject"] == "ab"
+    assert recording.unit == "uV"
+    trials = list(recording.trials())
+    assert len(trials) == 2 and trials[1].shape == (2, 128)
+    assert (trials[1][:, 0] == [1, 2]).all(), trials[1][:, 0]
+    rest = recording._file["data"]["rest"]
+    assert rest.shape == (2, 1)
+    assert recording._file[rest[0, 0]].shape == (64, 2)
+    assert "MATLAB_empty" in recording._file[rest[1, 0]].attrs
+    recording.close()
+
+def main():
+    folder = tempfile.mkdtemp()
+    try:
+        check_matlab_cues(folder)
+        check_session_writer(folder)
+    finally:
+        shutil.rmtree(folder)
+    print("OK")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:set et ts=4 sw=4:
+#
+## Copyright (C) 2013 Ozan Çağlayan <ocaglayan@gsu.edu.tr>
+##
+## This program is free software; you can redistribute it and/or modify
+## it under the terms of the GNU General Public License as published by
+## the Free Software Foundation; either version 2 of the License, or
+## (at your option) any later version.
+
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+## GNU General Public License for more details.
+
+## You should have received a copy of the GNU General Public License
+## along with this program; if not, write to the Free Software
+## Foundation, Inc., 675 Mass Ave, Cambridge, MA 02139, USA.
+
+"""\
+Re-run a classifier over many datasets on all cores.
+
+    bci-batch.py -o results.csv ~/BCIData/*/*/dataset.mat
+    bci-batch.py --block-size 128 -j 4 ~/BCIData
+
+Directories are searched for dataset.mat files. The per-trial results
+of each channel combination are written as CSV.
+"""
+
+import os
+import sys
+import csv
+import glob
+import argparse
+
+import numpy as np
+
+from emotiv import batch
+
+
+def find_datasets(paths):
+    for path in paths:
+        if os.path.isdir(path):
+            for dirpath, dirnames, filenames in os.walk(path):
+                if "dataset.mat" in filenames:
+                    yield os.path.join(dirpath, "dataset.mat")
+        else:
+            for filename in sorted(glob.glob(path)):
+                yield filename
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Batch analysis of datasets")
+    parser.add_argument("paths", nargs="+", help="datasets, globs or folders")
+    parser.add_argument("-c", "--classifier", default="psd",
+                        choices=sorted(batch.CLASSIFIERS))
+    parser.add_argument("-b", "--block-size", type=int, default=256)
+    parser.add_argument("-j", "--processes", type=int,
+                        help="worker processes (default: one per core)")
+    parser.add_argument("-o", "--output", help="CSV file for the results")
+    args = parser.parse_args()
+
+    filenames = list(find_datasets(args.paths))
+    if not filenames:
+        print "No datasets found."
+        return 1
+
+    def progress(result):
+        print "%s %s" % ("FAILED" if result["error"] else "done  ",
+                         result["file"])
+
+    rows, errors, throughput = batch.run(filenames, args.classifier,
+                                         args.block_size, args.processes,
+                                         callback=progress)
+
+    if args.output:
+        with open(args.output, "wb") as f:
+            writer = csv.writer(f)
+            writer.writerow(batch.COLUMNS)
+            writer.writerows(rows)
+
+    # Classification rates per channel combination over all trials
+    if rows:
+        labels = np.array([row[4] for row in rows])
+        hits = np.array([row[5] for row in rows])
+        print
+        for label in batch.CLASSIFIERS[args.classifier][1]:
+            mask = labels == label
+            print "%-10s %6.2f%% of %d trials" % (label,
+                                                  hits[mask].mean() * 100,
+                                                  mask.sum())
+
+    for filename, error in sorted(errors.items()):
+        print
+        print "%s failed:\n%s" % (filename, error)
+
+    print
+    print "%d files, %d trials in %.2f secs: %.2f files/s, %.0f samples/s" % (
+        throughput["files"], throughput["trials"], throughput["elapsed"],
+        throughput["files_per_sec"], throughput["samples_per_sec"])
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:set et ts=4 sw=4:
+#
+## Copyright (C) 2013 Ozan Çağlayan <ocaglayan@gsu.edu.tr>
+##
+## This program is free software; you can redistribute it and/or modify
+## it under the terms of the GNU General Public License as published by
+## the Free Software Foundation; either version 2 of the License, or
+## (at your option) any later version.
+
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+## GNU General Public License for more details.
+
+## You should have received a copy of the GNU General Public License
+## along with this program; if not, write to the Free Software
+## Foundation, Inc., 675 Mass Ave, Cambridge, MA 02139, USA.
+
+"""\
+Scan and query the catalog of recorded sessions.
+
+    bci-catalog.py scan
+    bci-catalog.py query --freq 15 --max-loss 0.01
+"""
+
+import sys
+import argparse
+
+from emotiv import catalog
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Catalog of BCI sessions")
+    parser.add_argument("--root", default=catalog.DATA_DIR,
+                        help="data directory (default: %(default)s)")
+    parser.add_argument("--database",
+                        help="catalog file (default: <root>/%s)" %
+                        catalog.CATALOG_NAME)
+    commands = parser.add_subparsers(dest="command")
+
+    scan = commands.add_parser("scan", help="index new and changed files")
+    scan.add_argument("-v", "--verbose", action="store_true")
+
+    query = commands.add_parser("query", help="list matching sessions")
+    query.add_argument("--freq", type=float)
+    query.add_argument("--subject")
+    query.add_argument("--max-loss", type=float,
+                       help="maximum packet loss ratio, e.g. 0.01")
+    query.add_argument("--min-battery", type=float)
+    query.add_argument("--min-duration", type=float)
+    query.add_argument("--channels", nargs="+")
+
+    args = parser.parse_args()
+    cat = catalog.Catalog(args.root, args.database)
+
+    if args.command == "scan":
+        updated, removed = cat.scan(verbose=args.verbose)
+        print "%d sessions, %d indexed, %d removed" % (len(cat), updated,
+                                                       removed)
+    else:
+        for entry in cat.query(freq=args.freq, subject=args.subject,
+                               max_loss=args.max_loss,
+                               min_battery=args.min_battery,
+                               min_duration=args.min_duration,
+                               channels=args.channels):
+            print "%s\t%s\t%sHz/%sHz\tloss %s\t%s" % (
+                entry["subject"], entry["date"], entry["freq_left"],
+                entry["freq_right"], entry["loss_ratio"], entry["path"])
+
+    cat.close()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
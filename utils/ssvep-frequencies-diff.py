@@ -9,6 +9,8 @@ from scipy import fftpack, signal
 from scipy.io import loadmat
 from matplotlib import pylab as plt
 
+from emotiv.montage import Montage
+
 if __name__ == '__main__':
     try:
         folder = sys.argv[1]
@@ -34,9 +36,10 @@ if __name__ == '__main__':
         #rest = signal.detrend(resting_sig[channel][0,:])
         #ssvep = signal.detrend(ssvep_sig[channel][0,:])
         #rest = resting_sig[channel][0,:]
-        ssvep_ch1 = ssvep_sig[ch1][0,int(cut):]
-        ssvep_ch2 = ssvep_sig[ch2][0,int(cut):]
-        diff_signal = ssvep_ch1 - ssvep_ch2
+        ssvep = np.vstack((ssvep_sig[ch1][0,int(cut):],
+                           ssvep_sig[ch2][0,int(cut):]))
+        montage = Montage([ch1, ch2]).bipolar(ch1, ch2)
+        diff_signal = montage.apply(ssvep)[0]
 
         diff_fft = fftpack.fft(diff_signal)
 
@@ -47,6 +50,7 @@ if __name__ == '__main__':
         #sig_diff_power = (sig_diff_power / sig_diff_power.max()) * 100
         #freqs, sig_diff_power = signal.welch(diff_signal, fs=128)
 
-        plt.plot(freqs, sig_diff_power)
+        plt.plot(freqs, sig_diff_power, label=montage.labels[0])
+        plt.legend()
         #fig.tight_layout()
         plt.show()